@@ -0,0 +1,551 @@
+"""Замеры производительности модуля homework.
+
+Запуск набора замеров горячих путей с сохранением результатов в JSON:
+    python benchmark.py run [--max-size N] [--output results.json]
+Сравнение результатов двух ревизий:
+    python benchmark.py compare old.json new.json [--threshold 0.1]
+Отдельные отчёты:
+    python benchmark.py {dispatch,formulas,memory,message,metrics,packed,
+                         threads,validation} [--count N]
+"""
+import argparse
+import gc
+import io
+import json
+import platform
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import timeit
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import redirect_stdout
+from dataclasses import asdict
+from typing import Any, Callable, Dict, List
+
+import homework
+
+PACKAGES: Dict[str, List[float]] = {
+    'SWM': [720, 1, 80, 25, 40],
+    'RUN': [15000, 1, 75],
+    'WLK': [9000, 1, 75, 180],
+}
+
+
+def measure_memory(build: Callable[[], object]) -> int:
+    """Получить объём памяти, занятый результатом build, в байтах."""
+    tracemalloc.start()
+    try:
+        result = build()
+        size, _ = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    del result
+    return size
+
+
+def bench_memory(count: int) -> None:
+    """Сравнить память объектов тренировок, их вариантов со __slots__
+    и журнала TrainingLog."""
+    for workout_type, data in PACKAGES.items():
+        rows = [[value + index for value in data] for index in range(count)]
+        training_class = type(homework.read_package(workout_type, data))
+
+        def build_objects():
+            return [training_class(*row) for row in rows]
+
+        def build_slotted():
+            slotted_class = homework.slotted_training_class(training_class)
+            return [slotted_class(*row) for row in rows]
+
+        def build_log():
+            log = homework.TrainingLog(training_class)
+            log.extend(rows)
+            return log
+
+        def build_messages():
+            return [training_class(*row).show_training_info()
+                    for row in rows]
+
+        objects = measure_memory(build_objects)
+        slotted = measure_memory(build_slotted)
+        log = measure_memory(build_log)
+        messages = measure_memory(build_messages)
+        print(f'{workout_type}: objects {objects / count:.1f} B/row, '
+              f'slotted {slotted / count:.1f} B/row '
+              f'({objects / slotted:.1f}x), '
+              f'TrainingLog {log / count:.1f} B/row '
+              f'({objects / log:.1f}x), '
+              f'InfoMessage {messages / count:.1f} B/row')
+
+
+def measure_rate(func: Callable[[], object], count: int) -> float:
+    """Получить количество вызовов func в секунду (лучшее из пяти)."""
+    return count / min(timeit.repeat(func, number=count, repeat=5))
+
+
+def bench_message(count: int) -> None:
+    """Сравнить форматирование сообщений через asdict и быстрый путь."""
+    info = homework.read_package('RUN', PACKAGES['RUN']).show_training_info()
+    infos = [info] * count
+
+    def asdict_message():
+        return info.MESSAGE.format(**asdict(info))
+
+    assert asdict_message() == info.get_message()
+    baseline = measure_rate(asdict_message, count)
+    fast = measure_rate(info.get_message, count)
+    print(f'asdict get_message: {baseline:,.0f} msg/s')
+    print(f'get_message: {fast:,.0f} msg/s ({fast / baseline:.1f}x)')
+
+    def bulk():
+        homework.write_messages(infos, io.StringIO())
+
+    bulk_rate = measure_rate(bulk, 1) * count
+    print(f'write_messages: {bulk_rate:,.0f} msg/s '
+          f'({bulk_rate / baseline:.1f}x)')
+
+
+def read_package_baseline(workout_type: str,
+                          data: list) -> homework.Training:
+    """read_package до введения реестра WORKOUT_TYPES."""
+    dict_packages: Dict[str, type] = {
+        'SWM': homework.Swimming,
+        'RUN': homework.Running,
+        'WLK': homework.SportsWalking
+    }
+
+    if workout_type in dict_packages:
+        return dict_packages[workout_type](*data)
+    raise ValueError('WorkoutNotFound')
+
+
+def bench_dispatch(count: int) -> None:
+    """Сравнить скорость разбора пакетов до и после реестра."""
+    packages = list(PACKAGES.items()) * (count // len(PACKAGES))
+
+    def baseline():
+        for package in packages:
+            read_package_baseline(*package)
+
+    def read_package():
+        for package in packages:
+            homework.read_package(*package)
+
+    def read_packages():
+        homework.read_packages(packages)
+
+    funcs = {'baseline read_package': baseline,
+             'read_package': read_package,
+             'read_packages': read_packages}
+    # Замеры чередуются, чтобы фоновая нагрузка делилась между вариантами.
+    timings: Dict[str, list] = {name: [] for name in funcs}
+    for _ in range(10):
+        for name, func in funcs.items():
+            timings[name].append(timeit.timeit(func, number=1))
+    results = {name: len(packages) / min(times)
+               for name, times in timings.items()}
+    for name, rate in results.items():
+        print(f'{name}: {rate:,.0f} calls/s '
+              f'({rate / results["baseline read_package"]:.2f}x)')
+
+
+def bench_metrics(count: int) -> None:
+    """Сравнить сквозной поток без метрик, с метриками и после них."""
+    packages = list(PACKAGES.items()) * (count // len(PACKAGES))
+
+    def end_to_end():
+        with redirect_stdout(io.StringIO()):
+            for workout_type, data in packages:
+                homework.main(homework.read_package(workout_type, data))
+
+    baseline = measure_rate(end_to_end, 1) * len(packages)
+    homework.enable_metrics()
+    try:
+        enabled = measure_rate(end_to_end, 1) * len(packages)
+    finally:
+        homework.disable_metrics()
+    disabled = measure_rate(end_to_end, 1) * len(packages)
+    print(f'never enabled: {baseline:,.0f} packages/s')
+    print(f'enabled: {enabled:,.0f} packages/s '
+          f'({enabled / baseline:.2f}x)')
+    print(f'disabled: {disabled:,.0f} packages/s '
+          f'({disabled / baseline:.2f}x)')
+
+
+def bench_packed(count: int) -> None:
+    """Сравнить чтение пакетов из JSON Lines, CSV и двоичного формата."""
+    packages = make_mixed_packages(count)
+    with tempfile.TemporaryDirectory() as directory:
+        paths = {fmt: os.path.join(directory, f'packages.{fmt}')
+                 for fmt in ('jsonl', 'csv', 'bin')}
+        with open(paths['jsonl'], 'w') as file:
+            file.writelines(json.dumps(package) + '\n'
+                            for package in packages)
+        with open(paths['csv'], 'w') as file:
+            file.writelines(','.join(map(str, [workout_type, *data])) + '\n'
+                            for workout_type, data in packages)
+        homework.convert_packages(paths['jsonl'], paths['bin'])
+
+        def read_text(fmt):
+            def run():
+                with open(paths[fmt], newline='') as file:
+                    for _ in homework.iter_packages(file, fmt):
+                        pass
+            return run
+
+        def read_bin():
+            for _ in homework.iter_packed(paths['bin']):
+                pass
+
+        baseline = measure_rate(read_text('jsonl'), 1) * count
+        for name, run in [('jsonl', read_text('jsonl')),
+                          ('csv', read_text('csv')),
+                          ('packed', read_bin)]:
+            rate = measure_rate(run, 1) * count
+            size = os.path.getsize(paths['bin' if name == 'packed'
+                                         else name])
+            print(f'{name}: {rate:,.0f} packages/s '
+                  f'({rate / baseline:.1f}x), {size / count:.1f} B/package')
+
+
+def bench_threads(count: int) -> None:
+    """Сравнить print из потоков и Reporter при разном числе потоков."""
+    packages = make_mixed_packages(count)
+
+    for threads in (1, 2, 4, 8):
+        shards = [packages[index::threads] for index in range(threads)]
+
+        def printing():
+            def work(shard):
+                for workout_type, data in shard:
+                    homework.main(homework.read_package(workout_type, data))
+
+            with redirect_stdout(io.StringIO()):
+                with ThreadPoolExecutor(threads) as executor:
+                    list(executor.map(work, shards))
+
+        def reporting():
+            def work(shard):
+                for workout_type, data in shard:
+                    reporter.report_package(workout_type, data)
+
+            with homework.Reporter(io.StringIO()) as reporter:
+                with ThreadPoolExecutor(threads) as executor:
+                    list(executor.map(work, shards))
+
+        printed = measure_rate(printing, 1) * count
+        reported = measure_rate(reporting, 1) * count
+        print(f'{threads} threads: print {printed:,.0f} packages/s, '
+              f'Reporter {reported:,.0f} packages/s '
+              f'({reported / printed:.2f}x)')
+
+
+def bench_formulas(count: int) -> None:
+    """Сравнить обычные и свёрнутые формулы калорий."""
+    for workout_type in PACKAGES:
+        trainings = [homework.read_package(*package)
+                     for package in make_packages(workout_type, count)]
+
+        def original():
+            for training in trainings:
+                training.get_spent_calories()
+
+        def fast():
+            for training in trainings:
+                training.get_spent_calories_fast()
+
+        baseline = measure_rate(original, 1) * count
+        folded = measure_rate(fast, 1) * count
+        print(f'{type(trainings[0]).__name__}: '
+              f'get_spent_calories {baseline:,.0f} calls/s, '
+              f'get_spent_calories_fast {folded:,.0f} calls/s '
+              f'({folded / baseline:.2f}x)')
+
+        log = homework.TrainingLog(type(trainings[0]))
+        log.extend(data for _, data in make_packages(workout_type, count))
+
+        def batch():
+            log.training_class.calculate_batch(log.columns)
+
+        def batch_fast():
+            log.training_class.calculate_batch_fast(log.columns)
+
+        baseline = measure_rate(batch, 1) * count
+        folded = measure_rate(batch_fast, 1) * count
+        print(f'{type(trainings[0]).__name__}: '
+              f'calculate_batch {baseline:,.0f} rows/s, '
+              f'calculate_batch_fast {folded:,.0f} rows/s '
+              f'({folded / baseline:.2f}x)')
+
+
+def bench_validation(count: int) -> None:
+    """Замерить цену проверки пакетов на полностью корректном потоке."""
+    packages = make_mixed_packages(count)
+
+    def unchecked():
+        for _ in homework.iter_messages(packages):
+            pass
+
+    def checked():
+        for _ in homework.iter_valid_messages(packages, dead_letters.append):
+            pass
+
+    dead_letters: list = []
+    baseline = measure_rate(unchecked, 1) * count
+    validated = measure_rate(checked, 1) * count
+    assert not dead_letters
+    print(f'iter_messages: {baseline:,.0f} packages/s')
+    print(f'iter_valid_messages: {validated:,.0f} packages/s '
+          f'(overhead {1 - validated / baseline:+.1%})')
+
+    log = homework.TrainingLog(homework.SportsWalking)
+    log.extend(data for _, data in make_packages('WLK', count))
+
+    def batch():
+        log.calculate()
+
+    def validate():
+        homework.validate_batch('WLK', log.columns)
+
+    baseline = measure_rate(batch, 1) * count
+    validation = measure_rate(validate, 1) * count
+    validated = 1 / (1 / baseline + 1 / validation)
+    print(f'calculate_batch: {baseline:,.0f} rows/s')
+    print(f'validate_batch + calculate_batch: {validated:,.0f} rows/s '
+          f'(overhead {1 - validated / baseline:+.1%})')
+
+
+REPORTS: Dict[str, Callable[[int], None]] = {
+    'dispatch': bench_dispatch,
+    'formulas': bench_formulas,
+    'memory': bench_memory,
+    'message': bench_message,
+    'metrics': bench_metrics,
+    'packed': bench_packed,
+    'threads': bench_threads,
+    'validation': bench_validation,
+}
+
+Case = Callable[[int], Callable[[], object]]
+
+
+def make_packages(workout_type: str, size: int) -> List[tuple]:
+    """Получить size различающихся пакетов одного вида."""
+    data = PACKAGES[workout_type]
+    return [(workout_type, [data[0] + index] + data[1:])
+            for index in range(size)]
+
+
+def make_mixed_packages(size: int) -> List[tuple]:
+    """Получить size пакетов всех видов вперемешку."""
+    kinds = list(PACKAGES)
+    packages = []
+    for index in range(size):
+        workout_type = kinds[index % len(kinds)]
+        data = PACKAGES[workout_type]
+        packages.append((workout_type, [data[0] + index] + data[1:]))
+    return packages
+
+
+def case_read_package(size: int) -> Callable[[], object]:
+    packages = make_mixed_packages(size)
+    read_package = homework.read_package
+
+    def run():
+        for workout_type, data in packages:
+            read_package(workout_type, data)
+
+    return run
+
+
+def case_metric(workout_type: str, method: str) -> Case:
+    """Получить замер метода тренировки для одного вида."""
+    def setup(size: int) -> Callable[[], object]:
+        calls = [getattr(homework.read_package(*package), method)
+                 for package in make_packages(workout_type, size)]
+
+        def run():
+            for call in calls:
+                call()
+
+        return run
+
+    return setup
+
+
+def case_get_message(size: int) -> Callable[[], object]:
+    calls = [homework.read_package(*package).show_training_info().get_message
+             for package in make_mixed_packages(size)]
+
+    def run():
+        for call in calls:
+            call()
+
+    return run
+
+
+def case_main(size: int) -> Callable[[], object]:
+    packages = make_mixed_packages(size)
+    read_package = homework.read_package
+    main = homework.main
+
+    def run():
+        with redirect_stdout(io.StringIO()):
+            for workout_type, data in packages:
+                main(read_package(workout_type, data))
+
+    return run
+
+
+def build_cases() -> Dict[str, Case]:
+    """Собрать случаи набора замеров."""
+    cases: Dict[str, Case] = {'read_package': case_read_package}
+    for workout_type, data in PACKAGES.items():
+        name = type(homework.read_package(workout_type, data)).__name__
+        for method in ('get_distance', 'get_mean_speed',
+                       'get_spent_calories'):
+            cases[f'{name}.{method}'] = case_metric(workout_type, method)
+    cases['InfoMessage.get_message'] = case_get_message
+    cases['main'] = case_main
+    return cases
+
+
+CASES = build_cases()
+
+
+def percentile(values: List[float], percent: float) -> float:
+    """Получить перцентиль методом ближайшего ранга."""
+    ordered = sorted(values)
+    rank = max(1, -(-len(ordered) * percent // 100))
+    return ordered[int(rank) - 1]
+
+
+def run_case(setup: Case, size: int, repeat: int) -> Dict[str, float]:
+    """Замерить один случай для размера порции size.
+
+    Задержка одной операции считается как время прогона, делённое на size;
+    перцентили берутся по прогонам. Пиковая память замеряется отдельным
+    прогоном под tracemalloc.
+    """
+    run = setup(size)
+    gc.collect()
+    gc_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        latencies = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            run()
+            latencies.append((time.perf_counter() - start) / size)
+    finally:
+        if gc_enabled:
+            gc.enable()
+    tracemalloc.start()
+    try:
+        run()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {
+        'ops_per_sec': 1 / percentile(latencies, 50),
+        'p50_seconds': percentile(latencies, 50),
+        'p99_seconds': percentile(latencies, 99),
+        'peak_memory_bytes': peak,
+        'repeat': repeat,
+    }
+
+
+def get_revision() -> str:
+    """Получить ревизию git текущего дерева, если она доступна."""
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def run_suite(cases: List[str],
+              sizes: List[int],
+              repeat: int) -> Dict[str, Any]:
+    """Прогнать выбранные случаи для всех размеров порции."""
+    results: Dict[str, Any] = {
+        'revision': get_revision(),
+        'python': sys.version.split()[0],
+        'platform': platform.platform(),
+        'results': {},
+    }
+    for name in cases:
+        for size in sizes:
+            rounds = max(3, min(repeat, 10 ** 6 // size))
+            result = run_case(CASES[name], size, rounds)
+            results['results'][f'{name}[{size}]'] = result
+            print(f'{name}[{size}]: {result["ops_per_sec"]:,.0f} ops/s, '
+                  f'p50 {result["p50_seconds"] * 1e9:,.0f} ns, '
+                  f'p99 {result["p99_seconds"] * 1e9:,.0f} ns, '
+                  f'peak {result["peak_memory_bytes"]:,} B')
+    return results
+
+
+def compare(old: Dict[str, Any],
+            new: Dict[str, Any],
+            threshold: float) -> bool:
+    """Сравнить ops/sec двух прогонов; вернуть True при регрессии."""
+    regressed = False
+    for key, new_result in new['results'].items():
+        old_result = old['results'].get(key)
+        if old_result is None:
+            continue
+        ratio = new_result['ops_per_sec'] / old_result['ops_per_sec']
+        mark = ''
+        if ratio < 1 - threshold:
+            mark = '  REGRESSION'
+            regressed = True
+        print(f'{key}: {ratio:.2f}x{mark}')
+    return regressed
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawTextHelpFormatter
+    )
+    commands = parser.add_subparsers(dest='command', required=True)
+    run = commands.add_parser('run', help='набор замеров горячих путей')
+    run.add_argument('--cases', nargs='+', choices=list(CASES),
+                     default=list(CASES))
+    run.add_argument('--max-size', type=int, default=10 ** 5,
+                     help='наибольший размер порции, до 10**7')
+    run.add_argument('--repeat', type=int, default=20)
+    run.add_argument('--output', help='файл для результатов в JSON')
+    compare_parser = commands.add_parser('compare',
+                                         help='сравнить два прогона')
+    compare_parser.add_argument('old')
+    compare_parser.add_argument('new')
+    compare_parser.add_argument('--threshold', type=float, default=0.1)
+    for name, report in REPORTS.items():
+        report_parser = commands.add_parser(name, help=report.__doc__)
+        report_parser.add_argument('--count', type=int, default=100_000)
+    args = parser.parse_args()
+
+    if args.command == 'run':
+        sizes = [10 ** power for power in range(8)
+                 if 10 ** power <= args.max_size]
+        results = run_suite(args.cases, sizes, args.repeat)
+        if args.output:
+            with open(args.output, 'w') as file:
+                json.dump(results, file, indent=2)
+    elif args.command == 'compare':
+        with open(args.old) as old, open(args.new) as new:
+            regressed = compare(json.load(old), json.load(new),
+                                args.threshold)
+        sys.exit(1 if regressed else 0)
+    else:
+        REPORTS[args.command](args.count)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,9 +1,41 @@
-from typing import Dict
-from dataclasses import dataclass, asdict
+"""Модуль фитнес-трекера.
+
+Модули, нужные только отдельным режимам (asyncio, csv, json,
+concurrent.futures, hashlib, mmap, multiprocessing, random, shelve,
+threading, typing, профилировщики), импортируются при первом
+использовании: запуск для одного пакета не должен платить за их загрузку.
+"""
+from __future__ import annotations
+
+import math
+import os
+import struct
+import sys
+import time
+from array import array
+from collections import OrderedDict, deque, namedtuple
+from functools import lru_cache, wraps
+from itertools import islice, repeat
+from dataclasses import asdict, dataclass, field
+
+TYPE_CHECKING = False
+if TYPE_CHECKING:
+    import asyncio
+    from concurrent.futures import Future
+    from typing import (IO, Any, Callable, Dict, Iterable, Iterator, List,
+                        Optional, Sequence, TextIO, Tuple, Type)
+
+    Columns = Dict[str, Sequence[float]]
+    Package = Tuple[str, list]
+    AggregateKey = Tuple[str, str, float]
+    UserKey = Tuple[str, str]
+    UserRecord = Tuple[str, Package]
 
 
 @dataclass
 class InfoMessage:
+    __slots__ = ('training_type', 'duration', 'distance', 'speed', 'calories')
+
     training_type: str
     duration: float
     distance: float
@@ -19,7 +51,17 @@ class InfoMessage:
     )
 
     def get_message(self) -> str:
-        return self.MESSAGE.format(**asdict(self))
+        return compile_message_template(self.MESSAGE).format(
+            self.training_type,
+            self.duration,
+            self.distance,
+            self.speed,
+            self.calories,
+        )
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Получить поля сообщения в виде словаря без глубокого копирования."""
+        return {name: getattr(self, name) for name in self.__slots__}
 
     def print_message(self) -> None:
         """Информационное сообщение о тренировке."""
@@ -27,10 +69,51 @@ class InfoMessage:
         print(self.get_message())
 
 
+@lru_cache(maxsize=None)
+def compile_message_template(template: str) -> str:
+    """Заменить имена полей InfoMessage в шаблоне на их номера.
+
+    Позиционный шаблон форматируется без промежуточного словаря полей.
+    """
+    from string import Formatter
+
+    names = InfoMessage.__slots__
+    parts = []
+    for literal, name, spec, conversion in Formatter().parse(template):
+        parts.append(literal.replace('{', '{{').replace('}', '}}'))
+        if name is None:
+            continue
+        conversion = '!' + conversion if conversion else ''
+        spec = ':' + spec if spec else ''
+        parts.append(f'{{{names.index(name)}{conversion}{spec}}}')
+    return ''.join(parts)
+
+
+def write_messages(messages: Iterable[InfoMessage],
+                   stream: IO,
+                   chunk_size: int = 1000,
+                   encoding: Optional[str] = None) -> int:
+    """Записать сообщения в поток крупными порциями, по строке на сообщение.
+
+    Если указана кодировка, в поток записываются байты.
+    Возвращает количество записанных сообщений.
+    """
+    count = 0
+    iterator = iter(messages)
+    while True:
+        chunk = [info.get_message() for info in islice(iterator, chunk_size)]
+        if not chunk:
+            return count
+        text = '\n'.join(chunk) + '\n'
+        stream.write(text.encode(encoding) if encoding else text)
+        count += len(chunk)
+
+
 class Training:
     """Базовый класс тренировки."""
     LEN_STEP: float = 0.65
     M_IN_KM: int = 1000
+    POSITIVE_FIELDS: Tuple[str, ...] = ('duration',)
 
     def __init__(self,
                  action: int,
@@ -55,6 +138,34 @@ class Training:
         """Получить количество затраченных калорий."""
         raise NotImplementedError('DataCouldNotBeRetrieved')
 
+    def get_spent_calories_fast(self) -> float:
+        """Получить калории по свёрнутым коэффициентам класса.
+
+        Совпадает с get_spent_calories с точностью до округления.
+        Класс без собственной быстрой формулы считает обычным путём.
+        """
+        return self.get_spent_calories()
+
+    def __init_subclass__(cls, **kwargs: Any) -> None:
+        super().__init_subclass__(**kwargs)
+        formulas = {'get_distance', 'get_mean_speed', 'get_spent_calories'}
+        if formulas & cls.__dict__.keys():
+            for name in ('get_spent_calories_fast',
+                         'get_batch_spent_calories',
+                         'get_batch_spent_calories_fast'):
+                if name not in cls.__dict__:
+                    setattr(cls, name, Training.__dict__[name])
+        cls.compile_coefficients()
+
+    @classmethod
+    def compile_coefficients(cls) -> None:
+        """Свернуть постоянные множители формул в коэффициенты класса.
+
+        Вызывается при создании каждого подкласса; после изменения
+        констант класса коэффициенты нужно пересчитать этим методом.
+        """
+        cls.DISTANCE_FACTOR = cls.LEN_STEP / cls.M_IN_KM
+
     def show_training_info(self) -> InfoMessage:
         """Вернуть информационное сообщение о выполненной тренировке."""
         return InfoMessage(type(self).__name__,
@@ -63,7 +174,101 @@ class Training:
                            self.get_mean_speed(),
                            self.get_spent_calories())
 
+    @classmethod
+    def get_fields(cls) -> Tuple[str, ...]:
+        """Получить имена полей пакета в порядке аргументов __init__."""
+        code = cls.__init__.__code__
+        return code.co_varnames[1:code.co_argcount]
+
+    @classmethod
+    def get_batch_distance(cls, columns: Columns) -> List[float]:
+        """Получить дистанции в км для колонок пакетов."""
+        return [action * cls.LEN_STEP / cls.M_IN_KM
+                for action in columns['action']]
+
+    @classmethod
+    def get_batch_mean_speed(cls, columns: Columns) -> List[float]:
+        """Получить средние скорости для колонок пакетов."""
+        return [distance / duration
+                for distance, duration in zip(cls.get_batch_distance(columns),
+                                              columns['duration'])]
+
+    @classmethod
+    def get_batch_spent_calories(cls,
+                                 columns: Columns,
+                                 speed: List[float]) -> List[float]:
+        """Получить затраченные калории для колонок пакетов.
+
+        Класс без собственной быстрой формулы считает по объектам.
+        """
+        rows = zip(*(columns[name] for name in cls.get_fields()))
+        return [cls(*data).get_spent_calories() for data in rows]
+
+    @classmethod
+    def get_batch_spent_calories_fast(cls,
+                                      columns: Columns,
+                                      speed: List[float]) -> List[float]:
+        """Получить калории для колонок по свёрнутым коэффициентам.
+
+        Совпадает с get_batch_spent_calories с точностью до округления.
+        Класс без собственной быстрой формулы считает обычным путём.
+        """
+        return cls.get_batch_spent_calories(columns, speed)
+
+    @classmethod
+    def calculate_batch(cls, columns: Columns) -> Dict[str, List[float]]:
+        """Рассчитать дистанцию, скорость и калории за один проход.
+
+        Результат совпадает с расчётом по объектам до последнего бита.
+        """
+        speed = cls.get_batch_mean_speed(columns)
+        return {'distance': cls.get_batch_distance(columns),
+                'speed': speed,
+                'calories': cls.get_batch_spent_calories(columns, speed)}
+
+    @classmethod
+    def calculate_batch_fast(cls,
+                             columns: Columns) -> Dict[str, List[float]]:
+        """Рассчитать показатели с калориями по свёрнутым коэффициентам.
+
+        Калории совпадают с calculate_batch с точностью до округления.
+        """
+        speed = cls.get_batch_mean_speed(columns)
+        return {'distance': cls.get_batch_distance(columns),
+                'speed': speed,
+                'calories': cls.get_batch_spent_calories_fast(columns,
+                                                              speed)}
 
+
+class WorkoutSchema(namedtuple('WorkoutSchema',
+                               ['training_class', 'fields', 'positive'])):
+    """Класс тренировки, поля пакета и номера положительных полей."""
+    __slots__ = ()
+
+
+WORKOUT_TYPES: Dict[str, WorkoutSchema] = {}
+WORKOUT_READERS: Dict[str, Tuple[Type[Training], int]] = {}
+NUMBER_TYPES = (int, float)
+
+
+def register_workout(
+        workout_type: str) -> Callable[[Type[Training]], Type[Training]]:
+    """Зарегистрировать класс тренировки для кода пакета."""
+    def decorator(training_class: Type[Training]) -> Type[Training]:
+        fields = training_class.get_fields()
+        WORKOUT_TYPES[workout_type] = WorkoutSchema(
+            training_class,
+            fields,
+            tuple(fields.index(name)
+                  for name in training_class.POSITIVE_FIELDS),
+        )
+        WORKOUT_READERS[workout_type] = (training_class, len(fields))
+        return training_class
+
+    return decorator
+
+
+@register_workout('RUN')
 class Running(Training):
     """Тренировка: бег."""
 
@@ -83,13 +288,65 @@ class Running(Training):
 
         return calories
 
+    @classmethod
+    def compile_coefficients(cls) -> None:
+        super().compile_coefficients()
+        cls.CALORIES_ACTION_FACTOR = (cls.CALORIES_MEAN_SPEED_MULTIPLIER
+                                      * cls.DISTANCE_FACTOR
+                                      * cls.SEC_IN_MIN
+                                      / cls.M_IN_KM)
+        cls.CALORIES_DURATION_FACTOR = (cls.CALORIES_MEAN_SPEED_SHIFT
+                                        * cls.SEC_IN_MIN
+                                        / cls.M_IN_KM)
+
+    @classmethod
+    def get_folded_calories(cls,
+                            action: int,
+                            duration: float,
+                            weight: float) -> float:
+        """Получить калории по полям пакета и свёрнутым коэффициентам."""
+        return ((cls.CALORIES_ACTION_FACTOR * action
+                 - cls.CALORIES_DURATION_FACTOR * duration)
+                * weight)
+
+    def get_spent_calories_fast(self) -> float:
+        return self.get_folded_calories(self.action,
+                                        self.duration,
+                                        self.weight)
+
+    @classmethod
+    def get_batch_spent_calories(cls,
+                                 columns: Columns,
+                                 speed: List[float]) -> List[float]:
+        return [(cls.CALORIES_MEAN_SPEED_MULTIPLIER
+                 * medium_speed
+                 - cls.CALORIES_MEAN_SPEED_SHIFT)
+                * weight
+                / cls.M_IN_KM
+                * duration
+                * cls.SEC_IN_MIN
+                for medium_speed, weight, duration in zip(speed,
+                                                          columns['weight'],
+                                                          columns['duration'])]
 
+    @classmethod
+    def get_batch_spent_calories_fast(cls,
+                                      columns: Columns,
+                                      speed: List[float]) -> List[float]:
+        return list(map(cls.get_folded_calories,
+                        columns['action'],
+                        columns['duration'],
+                        columns['weight']))
+
+
+@register_workout('WLK')
 class SportsWalking(Training):
     height: int
 
     CALORIES_MEAN_SPEED_MULTIPLIER: float = 0.035
     CALORIES_MEAN_SPEED_SHIFT: float = 0.029
     SEC_IN_MIN: int = 60
+    POSITIVE_FIELDS = ('duration', 'height')
 
     """Тренировка: спортивная ходьба."""
     def __init__(self,
@@ -113,7 +370,64 @@ class SportsWalking(Training):
 
         return calories
 
+    @classmethod
+    def compile_coefficients(cls) -> None:
+        super().compile_coefficients()
+        cls.CALORIES_WEIGHT_FACTOR = (cls.CALORIES_MEAN_SPEED_MULTIPLIER
+                                      * cls.SEC_IN_MIN)
+        cls.CALORIES_SPEED_FACTOR = (cls.CALORIES_MEAN_SPEED_SHIFT
+                                     * cls.SEC_IN_MIN)
+
+    def get_spent_calories_fast(self) -> float:
+        # Скорость считается как в get_mean_speed: от неё берётся
+        # целая часть, и расхождение в последнем бите изменило бы её.
+        speed = self.action * self.LEN_STEP / self.M_IN_KM / self.duration
+        return self.get_folded_calories(speed,
+                                        self.duration,
+                                        self.weight,
+                                        self.height)
 
+    @classmethod
+    def get_folded_calories(cls,
+                            speed: float,
+                            duration: float,
+                            weight: float,
+                            height: int) -> float:
+        """Получить калории по скорости, полям и свёрнутым коэффициентам."""
+        return ((cls.CALORIES_WEIGHT_FACTOR
+                 + speed**2 // height * cls.CALORIES_SPEED_FACTOR)
+                * weight
+                * duration)
+
+    @classmethod
+    def get_batch_spent_calories(cls,
+                                 columns: Columns,
+                                 speed: List[float]) -> List[float]:
+        return [(cls.CALORIES_MEAN_SPEED_MULTIPLIER
+                 * weight
+                 + (medium_speed**2 // height)
+                 * cls.CALORIES_MEAN_SPEED_SHIFT
+                 * weight)
+                * duration
+                * cls.SEC_IN_MIN
+                for medium_speed, weight, duration, height in zip(
+                    speed,
+                    columns['weight'],
+                    columns['duration'],
+                    columns['height'])]
+
+    @classmethod
+    def get_batch_spent_calories_fast(cls,
+                                      columns: Columns,
+                                      speed: List[float]) -> List[float]:
+        return list(map(cls.get_folded_calories,
+                        speed,
+                        columns['duration'],
+                        columns['weight'],
+                        columns['height']))
+
+
+@register_workout('SWM')
 class Swimming(Training):
     """Тренировка: плавание."""
     LEN_STEP = 1.38
@@ -147,18 +461,2122 @@ class Swimming(Training):
 
         return calories
 
+    @classmethod
+    def get_batch_mean_speed(cls, columns: Columns) -> List[float]:
+        return [length_pool
+                * count_pool
+                / cls.M_IN_KM
+                / duration
+                for length_pool, count_pool, duration in zip(
+                    columns['length_pool'],
+                    columns['count_pool'],
+                    columns['duration'])]
+
+    @classmethod
+    def get_batch_spent_calories(cls,
+                                 columns: Columns,
+                                 speed: List[float]) -> List[float]:
+        return [(medium_speed + cls.CALORIES_MEAN_SPEED_MULTIPLIER)
+                * cls.CALORIES_MEAN_SPEED_SHIFT
+                * weight
+                for medium_speed, weight in zip(speed, columns['weight'])]
+
+
+class TrainingView:
+    """Строка журнала тренировок без создания объекта тренировки."""
+    __slots__ = ('log', 'index')
+
+    def __init__(self, log: 'TrainingLog', index: int) -> None:
+        self.log = log
+        self.index = index
+
+    def __getattr__(self, name: str) -> float:
+        try:
+            column = self.log.columns[name]
+        except KeyError:
+            raise AttributeError(name) from None
+        return column[self.index]
+
+    def to_training(self) -> Training:
+        """Создать объект тренировки для этой строки."""
+        return self.log.training_class(*(
+            column[self.index] for column in self.log.columns.values()
+        ))
+
+
+class TrainingLog:
+    """Тренировки одного вида, хранящиеся колонками в массивах double."""
+
+    def __init__(self, training_class: Type[Training]) -> None:
+        self.training_class = training_class
+        self.columns: Dict[str, array] = {
+            name: array('d') for name in training_class.get_fields()
+        }
+
+    def __len__(self) -> int:
+        return len(self.columns['action'])
+
+    def __getitem__(self, index: int) -> TrainingView:
+        if not -len(self) <= index < len(self):
+            raise IndexError('TrainingLogIndexOutOfRange')
+        return TrainingView(self, index % len(self))
+
+    def append(self, data: Sequence[float]) -> None:
+        """Добавить данные одного пакета."""
+        if len(data) != len(self.columns):
+            raise ValueError('WrongPackageLength')
+        values = array('d', data)
+        for column, value in zip(self.columns.values(), values):
+            column.append(value)
+
+    def extend(self, packages: Iterable[Sequence[float]]) -> None:
+        """Добавить данные нескольких пакетов."""
+        for data in packages:
+            self.append(data)
+
+    def calculate(self) -> Dict[str, List[float]]:
+        """Рассчитать показатели всех тренировок журнала."""
+        return self.training_class.calculate_batch(self.columns)
+
+
+class CachedMetrics:
+    """Примесь: запоминает показатели тренировки до изменения её полей."""
+
+    def __setattr__(self, name: str, value: Any) -> None:
+        super().__setattr__(name, value)
+        self.invalidate_metrics()
+
+    def invalidate_metrics(self) -> None:
+        """Сбросить запомненные показатели."""
+        self.__dict__.pop('_metrics', None)
+
+    def _get_metric(self, name: str) -> float:
+        """Получить показатель из кэша или рассчитать его."""
+        metrics = self.__dict__.setdefault('_metrics', {})
+        if name not in metrics:
+            metrics[name] = getattr(super(), name)()
+        return metrics[name]
+
+    def get_distance(self) -> float:
+        return self._get_metric('get_distance')
+
+    def get_mean_speed(self) -> float:
+        return self._get_metric('get_mean_speed')
+
+    def get_spent_calories(self) -> float:
+        return self._get_metric('get_spent_calories')
+
+
+@lru_cache(maxsize=None)
+def cached_training_class(training_class: Type[Training]) -> type:
+    """Получить вариант класса тренировки с запоминанием показателей.
+
+    Обычные классы остаются без изменений, поэтому однократный расчёт
+    не платит за кэш.
+    """
+    if issubclass(training_class, CachedMetrics):
+        return training_class
+    return type(training_class.__name__,
+                (CachedMetrics, training_class),
+                {'__module__': training_class.__module__,
+                 '__qualname__': training_class.__qualname__})
+
+
+@lru_cache(maxsize=None)
+def slotted_training_class(training_class: Type[Training]) -> type:
+    """Получить вариант класса тренировки с полями в __slots__.
+
+    У Training нет __slots__, поэтому вариант не наследуется от него:
+    константы и методы всей иерархии копируются в новый класс, а его
+    экземпляры хранят поля пакета без __dict__. Методы копируемых
+    классов не должны вызывать super().
+    """
+    fields = training_class.get_fields()
+    namespace: Dict[str, Any] = {}
+    for klass in reversed(training_class.__mro__[:-1]):
+        namespace.update(vars(klass))
+    for name in ('__dict__', '__weakref__', '__init_subclass__',
+                 'compile_coefficients'):
+        namespace.pop(name, None)
+
+    def __init__(self: Any, *data: float) -> None:
+        if len(data) != len(fields):
+            raise ValueError('WrongPackageLength')
+        for name, value in zip(fields, data):
+            setattr(self, name, value)
+
+    def get_fields(cls: type) -> Tuple[str, ...]:
+        return fields
+
+    namespace.update(__init__=__init__,
+                     __slots__=fields,
+                     get_fields=classmethod(get_fields))
+    return type(training_class.__name__, (), namespace)
+
+
+def resolve_package(workout_type: str, data: Sequence) -> Type[Training]:
+    """Проверить код и длину пакета и вернуть класс тренировки."""
+    try:
+        training_class, arity = WORKOUT_READERS[workout_type]
+    except KeyError:
+        raise ValueError('WorkoutNotFound') from None
+    if len(data) != arity:
+        raise ValueError('WrongPackageLength')
+    return training_class
+
+
+def check_package(workout_type: str, data: Sequence) -> WorkoutSchema:
+    """Проверить код, длину и типы полей пакета и вернуть его схему."""
+    resolve_package(workout_type, data)
+    for value in data:
+        if not isinstance(value, NUMBER_TYPES):
+            raise TypeError('WrongFieldType')
+    return WORKOUT_TYPES[workout_type]
+
 
 def read_package(workout_type: str, data: list) -> Training:
-    """Прочитать данные полученные от датчиков."""
-    dict_packages: Dict[str, type] = {
-        'SWM': Swimming,
-        'RUN': Running,
-        'WLK': SportsWalking
-    }
+    """Прочитать данные полученные от датчиков.
+
+    Проверяются только код и длина пакета; типы полей проверяет
+    validate_package.
+    """
+    return resolve_package(workout_type, data)(*data)
+
+
+def read_packages(packages: Iterable[Package]) -> List[Training]:
+    """Прочитать несколько пакетов за один вызов."""
+    return [resolve_package(workout_type, data)(*data)
+            for workout_type, data in packages]
+
+
+@dataclass
+class PipelineStats:
+    """Статистика обработки потока пакетов."""
+    packages: int = 0
+    seconds: float = 0.0
+
+    @property
+    def throughput(self) -> float:
+        """Количество пакетов в секунду."""
+        if not self.seconds:
+            return 0.0
+        return self.packages / self.seconds
+
+
+def _to_number(value: str) -> float:
+    """Преобразовать поле CSV в число."""
+    try:
+        return int(value)
+    except ValueError:
+        return float(value)
+
+
+def iter_packages(stream: Iterable[str],
+                  fmt: str = 'jsonl') -> Iterator[Package]:
+    """Лениво прочитать пакеты из потока JSON Lines или CSV."""
+    if fmt == 'jsonl':
+        import json
+
+        for line in stream:
+            if line.strip():
+                workout_type, data = json.loads(line)
+                yield workout_type, data
+    elif fmt == 'csv':
+        import csv
+
+        for row in csv.reader(stream):
+            if row:
+                workout_type, *data = row
+                yield workout_type, [_to_number(value) for value in data]
+    else:
+        raise ValueError('FormatNotSupported')
+
+
+def iter_messages(packages: Iterable[Package]) -> Iterator[InfoMessage]:
+    """Лениво рассчитать сообщения для потока пакетов."""
+    for workout_type, data in packages:
+        yield read_package(workout_type, data).show_training_info()
+
+
+def validate_package(workout_type: str, data: list) -> Optional[str]:
+    """Получить причину отклонения пакета или None для корректного."""
+    try:
+        schema = check_package(workout_type, data)
+    except (ValueError, TypeError) as error:
+        return str(error)
+    for index in schema.positive:
+        if not data[index] > 0:
+            return f'NonPositiveField:{schema.fields[index]}'
+    return None
+
+
+ORDINARY_TOP_BYTES = bytes(range(0x01, 0x7F))
+TOP_BYTE = 7 if sys.byteorder == 'little' else 0
+
+
+def _is_ordinary_positive(column: Sequence[float]) -> bool:
+    """Быстро проверить, что все числа колонки положительны и конечны.
+
+    У массива array('d') смотрится только старший байт каждого double:
+    байты от 0x01 до 0x7E бывают лишь у положительных конечных чисел
+    примерно от 1e-303 до 1e303. Проверка идёт срезом и translate над
+    байтами, без создания объектов float. False не означает ошибку,
+    а только требует построчной проверки.
+    """
+    if isinstance(column, array) and column.typecode == 'd':
+        return not column.tobytes()[TOP_BYTE::8].translate(
+            None, ORDINARY_TOP_BYTES)
+    return min(column) > 0 and not math.isnan(sum(column))
+
+
+def validate_batch(workout_type: str,
+                   columns: Columns) -> List[Optional[str]]:
+    """Получить причины отклонения для колонок пакетов одного вида.
+
+    Колонки считаются числовыми (например, массивы TrainingLog);
+    проверяются положительные поля. Построчный проход нужен только
+    для колонок, не прошедших _is_ordinary_positive.
+    """
+    schema = WORKOUT_TYPES.get(workout_type)
+    if schema is None:
+        raise ValueError('WorkoutNotFound')
+    if set(columns) != set(schema.fields):
+        raise ValueError('WrongPackageLength')
+    reasons: List[Optional[str]] = [None] * len(columns['action'])
+    for index in schema.positive:
+        name = schema.fields[index]
+        column = columns[name]
+        if not column or _is_ordinary_positive(column):
+            continue
+        for row, value in enumerate(column):
+            if not value > 0 and reasons[row] is None:
+                reasons[row] = f'NonPositiveField:{name}'
+    return reasons
+
+
+class DeadLetterSink:
+    """Карантин отклонённых пакетов: строка JSON с пакетом и причиной."""
+
+    def __init__(self, stream: TextIO) -> None:
+        self.stream = stream
+        self.counts: Dict[str, int] = {}
+
+    def __call__(self, package: Package, reason: str) -> None:
+        import json
+
+        workout_type, data = package
+        self.stream.write(json.dumps({'workout_type': workout_type,
+                                      'data': list(data),
+                                      'reason': reason},
+                                     default=repr) + '\n')
+        self.counts[reason] = self.counts.get(reason, 0) + 1
+
+
+def iter_valid_messages(
+        packages: Iterable[Package],
+        dead_letter: Callable[[Package, str], None],
+) -> Iterator[InfoMessage]:
+    """Рассчитать сообщения, отправляя некорректные пакеты в dead_letter.
+
+    Один испорченный пакет не прерывает обработку остальных: пакет,
+    прошедший проверку, но сломавший расчёт (например, переполнением),
+    тоже уходит в dead_letter с причиной CalculationError:<тип ошибки>.
+    """
+    workout_types = WORKOUT_TYPES
+    for package in packages:
+        workout_type, data = package
+        reason = validate_package(workout_type, data)
+        if reason is not None:
+            dead_letter(package, reason)
+            continue
+        try:
+            training = workout_types[workout_type].training_class(*data)
+            info = training.show_training_info()
+        except (ArithmeticError, ValueError, TypeError) as error:
+            dead_letter(package, f'CalculationError:{type(error).__name__}')
+            continue
+        yield info
+
+
+def process_packages(packages: Iterable[Package],
+                     sink: TextIO,
+                     chunk_size: int = 1000) -> PipelineStats:
+    """Обработать поток пакетов порциями и записать сообщения в sink.
+
+    В памяти одновременно находится не больше одной порции: следующая
+    читается только после того, как sink принял предыдущую.
+    """
+    start = time.perf_counter()
+    count = write_messages(iter_messages(packages), sink, chunk_size)
+    return PipelineStats(count, time.perf_counter() - start)
+
+
+def iter_chunks(packages: Iterable[Package],
+                chunk_size: int) -> Iterator[List[Package]]:
+    """Разбить поток пакетов на порции."""
+    iterator = iter(packages)
+    while True:
+        chunk = list(islice(iterator, chunk_size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def _process_chunk(
+        chunk: List[Package]) -> Tuple[int, List[InfoMessage], float]:
+    """Обработать порцию пакетов в процессе-обработчике."""
+    start = time.perf_counter()
+    messages = list(iter_messages(chunk))
+    return os.getpid(), messages, time.perf_counter() - start
+
+
+def _collect_chunk(future: Future,
+                   stats: Optional[Dict[int, PipelineStats]],
+                   ) -> List[InfoMessage]:
+    """Забрать результат порции и учесть его в статистике обработчика."""
+    pid, messages, seconds = future.result()
+    if stats is not None:
+        worker_stats = stats.setdefault(pid, PipelineStats())
+        worker_stats.packages += len(messages)
+        worker_stats.seconds += seconds
+    return messages
+
+
+def run_parallel(packages: Iterable[Package],
+                 workers: Optional[int] = None,
+                 chunk_size: int = 1000,
+                 ordered: bool = True,
+                 stats: Optional[Dict[int, PipelineStats]] = None,
+                 ) -> Iterator[InfoMessage]:
+    """Обработать поток пакетов в пуле процессов.
+
+    Пакеты передаются обработчикам порциями по chunk_size, в работе
+    одновременно не больше двух порций на обработчик. При ordered=False
+    сообщения отдаются в порядке готовности порций. Если передан stats,
+    в него записывается статистика по PID обработчиков.
+    """
+    from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+    workers = workers or os.cpu_count() or 1
+    with ProcessPoolExecutor(workers) as executor:
+        pending: deque = deque()
+        for chunk in iter_chunks(packages, chunk_size):
+            pending.append(executor.submit(_process_chunk, chunk))
+            if len(pending) < 2 * workers:
+                continue
+            if ordered:
+                yield from _collect_chunk(pending.popleft(), stats)
+                continue
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                pending.remove(future)
+                yield from _collect_chunk(future, stats)
+        while pending:
+            yield from _collect_chunk(pending.popleft(), stats)
+
+
+def answer_frame(frame: bytes) -> Dict[str, Any]:
+    """Рассчитать ответ на один кадр вида ["RUN", [15000, 1, 75]]."""
+    import json
+
+    try:
+        workout_type, data = json.loads(frame)
+        return read_package(workout_type, data).show_training_info().to_dict()
+    except (ValueError, TypeError, ArithmeticError, RecursionError) as error:
+        return {'error': f'{type(error).__name__}: {error}'}
+
+
+FRAME_TOO_LONG = {'error': 'ValueError: FrameTooLong'}
+
+
+async def _skip_frame(reader: asyncio.StreamReader) -> None:
+    """Пропустить остаток кадра, не поместившегося в буфер StreamReader."""
+    import asyncio
+
+    while True:
+        try:
+            await reader.readuntil(b'\n')
+            return
+        except asyncio.IncompleteReadError:
+            return
+        except asyncio.LimitOverrunError as error:
+            await reader.readexactly(error.consumed)
+
+
+class PackageServer:
+    """Asyncio-сервер приёма пакетов по TCP или Unix-сокету.
+
+    Кадры и ответы передаются строками JSON Lines. Каждое соединение читает
+    кадры в ограниченную очередь: пока она заполнена, сокет не читается.
+    Кадры из очереди рассчитываются порциями до batch_size, ответы
+    отправляются с ожиданием drain(). Кадр длиннее ограничения
+    StreamReader получает ответ FRAME_TOO_LONG.
+    """
+
+    def __init__(self,
+                 host: str = '127.0.0.1',
+                 port: int = 0,
+                 path: Optional[str] = None,
+                 batch_size: int = 100,
+                 queue_size: int = 1000,
+                 close_timeout: float = 1.0) -> None:
+        self.host = host
+        self.port = port
+        self.path = path
+        self.batch_size = batch_size
+        self.queue_size = queue_size
+        self.close_timeout = close_timeout
+        self.server: Optional[asyncio.AbstractServer] = None
+        self.connections: set = set()
+
+    async def start(self) -> 'PackageServer':
+        """Начать приём соединений."""
+        import asyncio
+
+        if self.path:
+            self.server = await asyncio.start_unix_server(self.handle,
+                                                          self.path)
+        else:
+            self.server = await asyncio.start_server(self.handle,
+                                                     self.host,
+                                                     self.port)
+            self.port = self.server.sockets[0].getsockname()[1]
+        return self
+
+    async def close(self) -> None:
+        """Перестать принимать соединения и дождаться открытых.
+
+        Соединения, не закончившиеся за close_timeout секунд, закрываются.
+        """
+        import asyncio
+
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+        if not self.connections:
+            return
+        _, pending = await asyncio.wait(self.connections,
+                                        timeout=self.close_timeout)
+        for task in pending:
+            task.cancel()
+        if pending:
+            await asyncio.wait(pending)
+
+    async def __aenter__(self) -> 'PackageServer':
+        return await self.start()
+
+    async def __aexit__(self, *args: Any) -> None:
+        await self.close()
+
+    async def handle(self,
+                     reader: asyncio.StreamReader,
+                     writer: asyncio.StreamWriter) -> None:
+        """Обслужить одно соединение."""
+        import asyncio
+
+        task = asyncio.current_task()
+        self.connections.add(task)
+        queue: asyncio.Queue = asyncio.Queue(self.queue_size)
+        receiver = asyncio.ensure_future(self._receive(reader, queue))
+        try:
+            await self._respond(queue, writer)
+        except (asyncio.CancelledError, ConnectionError):
+            pass
+        finally:
+            receiver.cancel()
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except ConnectionError:
+                pass
+            self.connections.discard(task)
+
+    @staticmethod
+    async def _receive(reader: asyncio.StreamReader,
+                       queue: asyncio.Queue) -> None:
+        """Читать кадры из сокета в очередь до конца потока или обрыва."""
+        import asyncio
+
+        try:
+            while True:
+                try:
+                    line = await reader.readuntil(b'\n')
+                except asyncio.IncompleteReadError as error:
+                    line = error.partial
+                except asyncio.LimitOverrunError:
+                    await _skip_frame(reader)
+                    await queue.put(FRAME_TOO_LONG)
+                    continue
+                if not line:
+                    break
+                if line.strip():
+                    await queue.put(line)
+        except ConnectionError:
+            pass
+        await queue.put(None)
+
+    async def _respond(self,
+                       queue: asyncio.Queue,
+                       writer: asyncio.StreamWriter) -> None:
+        """Рассчитывать кадры порциями и отправлять ответы."""
+        import json
+
+        while True:
+            frames = [await queue.get()]
+            while frames[-1] is not None and not queue.empty():
+                if len(frames) == self.batch_size:
+                    break
+                frames.append(queue.get_nowait())
+            finished = frames[-1] is None
+            if finished:
+                frames.pop()
+            writer.write(b''.join(
+                json.dumps(answer_frame(frame) if isinstance(frame, bytes)
+                           else frame).encode() + b'\n'
+                for frame in frames
+            ))
+            await writer.drain()
+            if finished:
+                return
+
+
+async def send_packages(packages: Iterable[Package],
+                        host: str = '127.0.0.1',
+                        port: int = 0,
+                        path: Optional[str] = None) -> List[InfoMessage]:
+    """Отправить пакеты серверу и получить сообщения о тренировках."""
+    import asyncio
+    import json
+
+    if path:
+        reader, writer = await asyncio.open_unix_connection(path)
+    else:
+        reader, writer = await asyncio.open_connection(host, port)
+
+    async def send() -> None:
+        for package in packages:
+            writer.write(json.dumps(package).encode() + b'\n')
+            await writer.drain()
+        writer.write_eof()
+
+    sender = asyncio.ensure_future(send())
+    try:
+        answers = [json.loads(line) async for line in reader]
+        await sender
+    finally:
+        sender.cancel()
+        writer.close()
+    for answer in answers:
+        if 'error' in answer:
+            raise ValueError(answer['error'])
+    return [InfoMessage(**answer) for answer in answers]
+
+
+@dataclass
+class CallStats:
+    """Счётчики вызовов одной функции."""
+    count: int = 0
+    seconds: float = 0.0
+    buckets: List[int] = field(default_factory=list)
+
+
+class Metrics:
+    """Счётчики, время и гистограммы длительности вызовов."""
+    BUCKETS: Tuple[float, ...] = (1e-6, 2.5e-6, 5e-6, 1e-5, 2.5e-5, 5e-5,
+                                  1e-4, 1e-3, 1e-2, float('inf'))
+
+    def __init__(self) -> None:
+        self.calls: Dict[str, CallStats] = {}
+
+    def observe(self, name: str, seconds: float) -> None:
+        """Учесть вызов функции name длительностью seconds."""
+        stats = self.calls.get(name)
+        if stats is None:
+            stats = self.calls[name] = CallStats(
+                buckets=[0] * len(self.BUCKETS)
+            )
+        stats.count += 1
+        stats.seconds += seconds
+        for index, bound in enumerate(self.BUCKETS):
+            if seconds <= bound:
+                stats.buckets[index] += 1
+                break
+
+    def reset(self) -> None:
+        """Сбросить все счётчики."""
+        self.calls.clear()
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Получить счётчики в виде словаря для JSON."""
+        return {
+            name: {'count': stats.count,
+                   'seconds': stats.seconds,
+                   'buckets': dict(zip(map(str, self.BUCKETS),
+                                       stats.buckets))}
+            for name, stats in self.calls.items()
+        }
+
+    def to_prometheus(self) -> str:
+        """Получить счётчики в текстовом формате Prometheus."""
+        lines = ['# TYPE homework_call_seconds histogram']
+        for name, stats in self.calls.items():
+            cumulative = 0
+            for bound, count in zip(self.BUCKETS, stats.buckets):
+                cumulative += count
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                lines.append(f'homework_call_seconds_bucket'
+                             f'{{function="{name}",le="{le}"}} {cumulative}')
+            lines.append(f'homework_call_seconds_sum'
+                         f'{{function="{name}"}} {stats.seconds!r}')
+            lines.append(f'homework_call_seconds_count'
+                         f'{{function="{name}"}} {stats.count}')
+        return '\n'.join(lines) + '\n'
+
+    def export(self, path: str, fmt: str = 'prometheus') -> None:
+        """Записать счётчики в файл в формате prometheus или json."""
+        import json
+
+        if fmt == 'prometheus':
+            text = self.to_prometheus()
+        elif fmt == 'json':
+            text = json.dumps(self.to_dict(), indent=2)
+        else:
+            raise ValueError('FormatNotSupported')
+        with open(path, 'w') as file:
+            file.write(text)
+
+
+METRICS = Metrics()
+_INSTRUMENTED: List[Tuple[Any, str, Any]] = []
+
+
+def _instrument(owner: Any, attribute: str, name: str) -> None:
+    """Заменить функцию владельца обёрткой, считающей вызовы."""
+    for instrumented, instrumented_attribute, _ in _INSTRUMENTED:
+        if instrumented is owner and instrumented_attribute == attribute:
+            return
+    func = getattr(owner, attribute)
+
+    @wraps(func)
+    def wrapper(*args: Any, **kwargs: Any) -> Any:
+        start = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            METRICS.observe(name, time.perf_counter() - start)
+
+    _INSTRUMENTED.append((owner, attribute, owner.__dict__[attribute]))
+    setattr(owner, attribute, wrapper)
+
+
+def enable_metrics() -> Metrics:
+    """Включить сбор метрик горячих путей.
+
+    Функции подменяются обёртками только на время сбора, поэтому
+    выключенные метрики ничего не стоят.
+    """
+    if _INSTRUMENTED:
+        return METRICS
+    _instrument(sys.modules[__name__], 'read_package', 'read_package')
+    _instrument(Training, 'show_training_info', 'show_training_info')
+    _instrument(InfoMessage, 'get_message', 'get_message')
+    for schema in WORKOUT_TYPES.values():
+        training_class = schema.training_class
+        if 'get_spent_calories' in training_class.__dict__:
+            _instrument(training_class, 'get_spent_calories',
+                        f'{training_class.__name__}.get_spent_calories')
+    return METRICS
+
+
+def disable_metrics() -> None:
+    """Выключить сбор метрик и вернуть исходные функции."""
+    while _INSTRUMENTED:
+        owner, attribute, original = _INSTRUMENTED.pop()
+        setattr(owner, attribute, original)
+
+
+AGGREGATED_FIELDS = ('duration', 'distance', 'speed', 'calories')
+
+
+@dataclass
+class Aggregate:
+    """Накопленные суммы, минимумы и максимумы полей сообщений."""
+    count: int = 0
+    totals: Dict[str, float] = field(
+        default_factory=lambda: dict.fromkeys(AGGREGATED_FIELDS, 0.0)
+    )
+    minimums: Dict[str, float] = field(
+        default_factory=lambda: dict.fromkeys(AGGREGATED_FIELDS, math.inf)
+    )
+    maximums: Dict[str, float] = field(
+        default_factory=lambda: dict.fromkeys(AGGREGATED_FIELDS, -math.inf)
+    )
+
+    def add(self, info: InfoMessage) -> None:
+        """Учесть одно сообщение."""
+        self.count += 1
+        for name in AGGREGATED_FIELDS:
+            value = getattr(info, name)
+            self.totals[name] += value
+            if value < self.minimums[name]:
+                self.minimums[name] = value
+            if value > self.maximums[name]:
+                self.maximums[name] = value
+
+    def merge(self, other: 'Aggregate') -> None:
+        """Добавить итоги, накопленные в другом месте."""
+        self.count += other.count
+        for name in AGGREGATED_FIELDS:
+            self.totals[name] += other.totals[name]
+            self.minimums[name] = min(self.minimums[name],
+                                      other.minimums[name])
+            self.maximums[name] = max(self.maximums[name],
+                                      other.maximums[name])
+
+    def mean(self, name: str) -> float:
+        """Получить среднее значение поля."""
+        if not self.count:
+            return 0.0
+        return self.totals[name] / self.count
+
+
+class WindowedAggregator:
+    """Итоги по пользователю и виду тренировки во временных окнах.
+
+    При step=None окна неперекрывающиеся (tumbling), иначе скользящие:
+    окно длиной window начинается каждые step секунд. Обновление стоит
+    O(window / step) и не зависит от объёма накопленной истории.
+    """
+
+    def __init__(self, window: float, step: Optional[float] = None) -> None:
+        self.window = window
+        self.step = step or window
+        self.aggregates: Dict[AggregateKey, Aggregate] = {}
+
+    def window_starts(self, timestamp: float) -> List[float]:
+        """Получить начала окон, в которые попадает момент timestamp."""
+        start = timestamp // self.step * self.step
+        starts = []
+        while start > timestamp - self.window:
+            starts.append(start)
+            start -= self.step
+        return starts
+
+    def add(self, user: str, timestamp: float, info: InfoMessage) -> None:
+        """Учесть сообщение пользователя user в момент timestamp."""
+        for start in self.window_starts(timestamp):
+            key = (user, info.training_type, start)
+            aggregate = self.aggregates.get(key)
+            if aggregate is None:
+                aggregate = self.aggregates[key] = Aggregate()
+            aggregate.add(info)
+
+    def merge(self, other: 'WindowedAggregator') -> None:
+        """Добавить частичные итоги другого обработчика."""
+        if (other.window, other.step) != (self.window, self.step):
+            raise ValueError('WindowsDoNotMatch')
+        for key, aggregate in other.aggregates.items():
+            self.aggregates.setdefault(key, Aggregate()).merge(aggregate)
+
+    def pop_closed(self, watermark: float) -> Dict[AggregateKey, Aggregate]:
+        """Забрать итоги окон, закончившихся не позже watermark."""
+        closed = {key: aggregate
+                  for key, aggregate in self.aggregates.items()
+                  if key[2] + self.window <= watermark}
+        for key in closed:
+            del self.aggregates[key]
+        return closed
+
+
+PACKED_FIELDS = 5
+PACKED_RECORD = struct.Struct(f'<4s{PACKED_FIELDS}d')
+PACKED_DTYPE = [('workout_type', 'S4'), ('data', '<f8', (PACKED_FIELDS,))]
+
+
+def write_packed(packages: Iterable[Package], stream: IO[bytes]) -> int:
+    """Записать пакеты в двоичном формате фиксированной длины.
+
+    Запись: код тренировки (4 байта) и PACKED_FIELDS чисел double,
+    недостающие поля заполняются нулями. Возвращает количество записей.
+    """
+    count = 0
+    padding = [0.0] * PACKED_FIELDS
+    for chunk in iter_chunks(packages, 1000):
+        records = []
+        for workout_type, data in chunk:
+            check_package(workout_type, data)
+            if len(workout_type.encode()) > 4:
+                raise ValueError('WorkoutCodeTooLong')
+            try:
+                records.append(PACKED_RECORD.pack(
+                    workout_type.encode(),
+                    *data, *padding[len(data):]
+                ))
+            except struct.error:
+                raise TypeError('WrongFieldType') from None
+        stream.write(b''.join(records))
+        count += len(records)
+    return count
+
+
+def iter_packed(path: str) -> Iterator[Package]:
+    """Лениво прочитать пакеты из двоичного файла через mmap.
+
+    Записи разбираются прямо из отображённой памяти без копирования файла.
+    Тот же буфер можно открыть в NumPy как
+    numpy.frombuffer(buffer, dtype=PACKED_DTYPE).
+    """
+    import mmap
+
+    with open(path, 'rb') as file:
+        if not os.fstat(file.fileno()).st_size:
+            return
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+            if len(buffer) % PACKED_RECORD.size:
+                raise ValueError('TruncatedPackedFile')
+            lengths = {workout_type.encode().ljust(4, b'\0'): (
+                workout_type, len(schema.fields)
+            ) for workout_type, schema in WORKOUT_TYPES.items()}
+            view = memoryview(buffer)
+            try:
+                for code, *data in PACKED_RECORD.iter_unpack(view):
+                    if code not in lengths:
+                        raise ValueError('WorkoutNotFound')
+                    workout_type, length = lengths[code]
+                    yield workout_type, data[:length]
+            finally:
+                view.release()
+
+
+def read_packed_logs(path: str) -> Dict[str, TrainingLog]:
+    """Прочитать двоичный файл в журналы тренировок по видам."""
+    logs: Dict[str, TrainingLog] = {}
+    for workout_type, data in iter_packed(path):
+        log = logs.get(workout_type)
+        if log is None:
+            log = logs[workout_type] = TrainingLog(
+                WORKOUT_TYPES[workout_type].training_class
+            )
+        log.append(data)
+    return logs
+
+
+def convert_packages(source: str, target: str, fmt: str = 'jsonl') -> int:
+    """Преобразовать файл пакетов JSON Lines или CSV в двоичный формат."""
+    with open(source, newline='') as stream, open(target, 'wb') as packed:
+        return write_packed(iter_packages(stream, fmt), packed)
+
+
+class ResultCache:
+    """Потокобезопасный LRU-кэш сообщений для одинаковых пакетов.
+
+    Ключ - код тренировки и значения полей, приведённые к float. Записи
+    старше ttl секунд считаются устаревшими. Если задан path, записи
+    дублируются в файл shelve и переживают перезапуск процесса.
+    Возвращаемые сообщения общие для всех вызовов, изменять их нельзя.
+    """
+
+    def __init__(self,
+                 maxsize: int = 10000,
+                 ttl: Optional[float] = None,
+                 path: Optional[str] = None) -> None:
+        import shelve
+        import threading
+
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.entries: OrderedDict = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.store = shelve.open(path) if path else None
 
-    if workout_type in dict_packages:
-        return dict_packages[workout_type](*data)
-    raise ValueError('WorkoutNotFound')
+    @staticmethod
+    def make_key(workout_type: str, data: Sequence[float]) -> tuple:
+        """Получить нормализованный ключ пакета."""
+        for value in data:
+            if not isinstance(value, NUMBER_TYPES):
+                raise TypeError('WrongFieldType')
+        return (workout_type, *map(float, data))
+
+    def get_info(self, workout_type: str, data: list) -> InfoMessage:
+        """Получить сообщение о тренировке из кэша или рассчитать его."""
+        key = self.make_key(workout_type, data)
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry[0] > time.time():
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            entry = self._load(key)
+            if entry is not None:
+                self.disk_hits += 1
+                self._remember(key, entry)
+                return entry[1]
+            self.misses += 1
+        info = read_package(workout_type, data).show_training_info()
+        expires = time.time() + self.ttl if self.ttl else math.inf
+        with self.lock:
+            self._remember(key, (expires, info))
+            if self.store is not None:
+                self.store[self._disk_key(key)] = (expires, info)
+        return info
+
+    @staticmethod
+    def _disk_key(key: tuple) -> str:
+        """Получить адрес записи в постоянном хранилище."""
+        import hashlib
+
+        return hashlib.sha256(repr(key).encode()).hexdigest()
+
+    def _load(self, key: tuple) -> Optional[Tuple[float, InfoMessage]]:
+        """Прочитать свежую запись из постоянного хранилища."""
+        if self.store is None:
+            return None
+        entry = self.store.get(self._disk_key(key))
+        if entry is None or entry[0] <= time.time():
+            return None
+        return entry
+
+    def _remember(self,
+                  key: tuple,
+                  entry: Tuple[float, InfoMessage]) -> None:
+        """Положить запись в память, вытеснив самые старые."""
+        self.entries[key] = entry
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    def stats(self) -> Dict[str, int]:
+        """Получить статистику попаданий и промахов."""
+        with self.lock:
+            return {'hits': self.hits,
+                    'disk_hits': self.disk_hits,
+                    'misses': self.misses,
+                    'evictions': self.evictions,
+                    'size': len(self.entries)}
+
+    def close(self) -> None:
+        """Закрыть постоянное хранилище."""
+        with self.lock:
+            if self.store is not None:
+                self.store.close()
+                self.store = None
+
+
+class Reporter:
+    """Сбор сообщений в буферы потоков с крупной записью в общий sink.
+
+    Каждый поток копит сообщения в своём буфере и пишет их в sink одним
+    вызовом write под блокировкой, когда набирается batch_size строк.
+    report_package создаёт объект тренировки на каждый вызов, поэтому
+    потоки не разделяют изменяемого состояния и без GIL. Подходит любой
+    sink с методом write: файл, socket.makefile('wb'), StringIO; для
+    байтовых задаётся encoding.
+    """
+
+    def __init__(self,
+                 sink: IO,
+                 batch_size: int = 1000,
+                 encoding: Optional[str] = None) -> None:
+        import threading
+
+        self.sink = sink
+        self.batch_size = batch_size
+        self.encoding = encoding
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.buffers: List[List[str]] = []
+
+    def _get_buffer(self) -> List[str]:
+        """Получить буфер текущего потока."""
+        buffer = getattr(self.local, 'buffer', None)
+        if buffer is None:
+            buffer = self.local.buffer = []
+            with self.lock:
+                self.buffers.append(buffer)
+        return buffer
+
+    def report(self, training: Training) -> InfoMessage:
+        """Рассчитать сообщение о тренировке и добавить его в буфер."""
+        info = training.show_training_info()
+        buffer = self._get_buffer()
+        buffer.append(info.get_message())
+        if len(buffer) >= self.batch_size:
+            self._write(buffer)
+        return info
+
+    def report_package(self, workout_type: str, data: list) -> InfoMessage:
+        """Прочитать пакет и добавить сообщение о нём в буфер."""
+        return self.report(read_package(workout_type, data))
+
+    def _write(self, buffer: List[str]) -> None:
+        """Записать и очистить буфер."""
+        text = '\n'.join(buffer) + '\n'
+        buffer.clear()
+        data = text.encode(self.encoding) if self.encoding else text
+        with self.lock:
+            self.sink.write(data)
+
+    def flush(self) -> None:
+        """Записать буфер текущего потока."""
+        buffer = self._get_buffer()
+        if buffer:
+            self._write(buffer)
+
+    def close(self) -> None:
+        """Записать буферы всех потоков; вызывать после их остановки."""
+        with self.lock:
+            buffers = list(self.buffers)
+        for buffer in buffers:
+            if buffer:
+                self._write(buffer)
+        flush = getattr(self.sink, 'flush', None)
+        if flush is not None:
+            flush()
+
+    def __enter__(self) -> 'Reporter':
+        return self
+
+    def __exit__(self, *args: Any) -> None:
+        self.close()
+
+
+def export_csv(infos: Iterable[InfoMessage],
+               stream: TextIO,
+               chunk_size: int = 10000) -> int:
+    """Выгрузить сообщения в CSV с полной точностью чисел.
+
+    Возвращает количество выгруженных строк.
+    """
+    import csv
+
+    writer = csv.writer(stream)
+    writer.writerow(InfoMessage.__slots__)
+    count = 0
+    for chunk in iter_chunks(infos, chunk_size):
+        writer.writerows([(info.training_type, info.duration, info.distance,
+                           info.speed, info.calories) for info in chunk])
+        count += len(chunk)
+    return count
+
+
+def export_jsonl(infos: Iterable[InfoMessage],
+                 stream: TextIO,
+                 chunk_size: int = 10000) -> int:
+    """Выгрузить сообщения в JSON Lines с полной точностью чисел."""
+    import json
+
+    count = 0
+    for chunk in iter_chunks(infos, chunk_size):
+        stream.write(''.join(json.dumps(info.to_dict()) + '\n'
+                             for info in chunk))
+        count += len(chunk)
+    return count
+
+
+def export_columnar(infos: Iterable[InfoMessage],
+                    path: str,
+                    row_group_size: int = 65536,
+                    engine: str = 'auto') -> int:
+    """Выгрузить сообщения по колонкам группами по row_group_size строк.
+
+    engine='parquet' пишет Parquet через pyarrow, engine='json' - группы
+    колонок строками JSON ({"training_type": [...], ...} на группу),
+    engine='auto' выбирает Parquet, если pyarrow установлен.
+    """
+    if engine == 'auto':
+        from importlib.util import find_spec
+
+        engine = 'parquet' if find_spec('pyarrow') else 'json'
+    if engine == 'parquet':
+        return _export_parquet(infos, path, row_group_size)
+    if engine != 'json':
+        raise ValueError('FormatNotSupported')
+    import json
+
+    count = 0
+    with open(path, 'w') as stream:
+        for chunk in iter_chunks(infos, row_group_size):
+            stream.write(json.dumps(_to_columns(chunk)) + '\n')
+            count += len(chunk)
+    return count
+
+
+def _to_columns(infos: List[InfoMessage]) -> Dict[str, list]:
+    """Разложить сообщения по колонкам."""
+    return {name: [getattr(info, name) for info in infos]
+            for name in InfoMessage.__slots__}
+
+
+def _export_parquet(infos: Iterable[InfoMessage],
+                    path: str,
+                    row_group_size: int) -> int:
+    """Выгрузить сообщения в Parquet, по группе строк на порцию."""
+    import pyarrow
+    import pyarrow.parquet
+
+    schema = pyarrow.schema(
+        [('training_type', pyarrow.string())]
+        + [(name, pyarrow.float64()) for name in AGGREGATED_FIELDS]
+    )
+    count = 0
+    with pyarrow.parquet.ParquetWriter(path, schema) as writer:
+        for chunk in iter_chunks(infos, row_group_size):
+            writer.write_table(pyarrow.Table.from_pydict(
+                _to_columns(chunk), schema=schema
+            ))
+            count += len(chunk)
+    return count
+
+
+def iter_columnar(path: str) -> Iterator[Dict[str, list]]:
+    """Прочитать группы колонок, записанные export_columnar(engine='json')."""
+    import json
+
+    with open(path) as stream:
+        for line in stream:
+            yield json.loads(line)
+
+
+def _iter_archive_chunks(path: str,
+                         offset: int,
+                         chunk_size: int,
+                         tail: bool = False) -> Iterator[Tuple[bytes, int]]:
+    """Читать файл порциями по chunk_size строк начиная с offset.
+
+    Отдаёт содержимое порции и смещение её конца. Последняя строка без
+    перевода строки считается недописанной и пропускается, если tail
+    не указан.
+    """
+    with open(path, 'rb') as stream:
+        stream.seek(offset)
+        while True:
+            lines = []
+            for line in stream:
+                if not line.endswith(b'\n') and not tail:
+                    break
+                lines.append(line)
+                if len(lines) == chunk_size:
+                    break
+            if not lines:
+                return
+            chunk = b''.join(lines)
+            offset += len(chunk)
+            yield chunk, offset
+
+
+def _save_checkpoint(path: str,
+                     files: Dict[str, Dict[str, Any]],
+                     partials: Dict[str, Dict[str, Aggregate]]) -> None:
+    """Атомарно записать контрольную точку."""
+    import json
+
+    state = {'files': {
+        name: {**position, 'aggregates': {
+            training_type: asdict(aggregate)
+            for training_type, aggregate in partials[name].items()
+        }} for name, position in files.items()
+    }}
+    temporary = path + '.tmp'
+    with open(temporary, 'w') as stream:
+        json.dump(state, stream)
+    os.replace(temporary, path)
+
+
+def _is_resumable(path: str, position: Dict[str, Any]) -> bool:
+    """Проверить, что последняя обработанная порция файла не изменилась."""
+    import hashlib
+
+    offset, start = position['offset'], position['start']
+    if not offset:
+        return True
+    if offset > os.path.getsize(path):
+        return False
+    with open(path, 'rb') as stream:
+        stream.seek(start)
+        chunk = stream.read(offset - start)
+    return hashlib.sha256(chunk).hexdigest() == position['digest']
+
+
+def _replay_file(path: str,
+                 position: Dict[str, Any],
+                 aggregates: Dict[str, Aggregate],
+                 chunk_size: int,
+                 fmt: str,
+                 tail: bool,
+                 dead_letter: Optional[Callable[[Package, str], None]],
+                 ) -> Iterator[None]:
+    """Пересчитывать файл с position, отдавая управление после порций."""
+    import hashlib
+
+    def reject(package: Package, reason: str) -> None:
+        position['rejected'] += 1
+        if dead_letter is not None:
+            dead_letter(package, reason)
+
+    for chunk, offset in _iter_archive_chunks(path, position['offset'],
+                                              chunk_size, tail):
+        lines = chunk.decode().splitlines()
+        for info in iter_valid_messages(iter_packages(lines, fmt), reject):
+            aggregates.setdefault(info.training_type, Aggregate()).add(info)
+        position.update(offset=offset,
+                        start=offset - len(chunk),
+                        digest=hashlib.sha256(chunk).hexdigest())
+        yield
+    position['tail'] = os.path.getsize(path) - position['offset']
+
+
+def replay_archives(paths: Iterable[str],
+                    checkpoint: str,
+                    chunk_size: int = 10000,
+                    checkpoint_every: int = 10,
+                    fmt: str = 'jsonl',
+                    dead_letter: Optional[Callable[[Package, str],
+                                                   None]] = None,
+                    settle: float = 60.0) -> Dict[str, Aggregate]:
+    """Пересчитать архивы пакетов с контрольными точками.
+
+    Контрольная точка хранит для каждого файла смещение, хеш последней
+    обработанной порции и итоги по видам тренировок, накопленные
+    из этого файла. Повторный запуск продолжает файл с сохранённого
+    смещения, если последняя порция не изменилась; переписанный файл
+    пересчитывается с начала, а его прежние итоги отбрасываются.
+
+    Некорректные пакеты уходят в dead_letter и считаются в поле rejected
+    файла. Последняя строка без перевода строки обрабатывается, только
+    если файл не менялся settle секунд; иначе её длина в байтах
+    остаётся в поле tail до следующего запуска.
+    Возвращает итоги по всем файлам контрольной точки.
+    """
+    import json
+
+    files: Dict[str, Dict[str, Any]] = {}
+    partials: Dict[str, Dict[str, Aggregate]] = {}
+    if os.path.exists(checkpoint):
+        with open(checkpoint) as stream:
+            state = json.load(stream)
+        for name, position in state['files'].items():
+            partials[name] = {
+                training_type: Aggregate(**data)
+                for training_type, data in position.pop('aggregates').items()
+            }
+            files[name] = position
+    pending = 0
+    for path in paths:
+        position = files.get(path)
+        if position is None or not _is_resumable(path, position):
+            position = files[path] = {'offset': 0, 'start': 0, 'digest': '',
+                                      'rejected': 0, 'tail': 0}
+            partials[path] = {}
+        tail = time.time() - os.path.getmtime(path) >= settle
+        for _ in _replay_file(path, position, partials[path], chunk_size,
+                              fmt, tail, dead_letter):
+            pending += 1
+            if pending >= checkpoint_every:
+                _save_checkpoint(checkpoint, files, partials)
+                pending = 0
+    _save_checkpoint(checkpoint, files, partials)
+    totals: Dict[str, Aggregate] = {}
+    for aggregates in partials.values():
+        for training_type, aggregate in aggregates.items():
+            totals.setdefault(training_type, Aggregate()).merge(aggregate)
+    return totals
+
+
+WORKLOAD_MIX: Dict[str, float] = {'RUN': 0.5, 'WLK': 0.3, 'SWM': 0.2}
+WORKLOAD_RANGES: Dict[str, Tuple[float, float]] = {
+    'action': (1000, 20000),
+    'duration': (0.25, 2.0),
+    'weight': (50, 110),
+    'height': (150, 200),
+    'length_pool': (25, 50),
+    'count_pool': (10, 80),
+}
+
+
+WORKLOAD_ERRORS = ('WorkoutNotFound', 'WrongPackageLength',
+                   'WrongFieldType', 'NonPositiveField')
+
+
+def _uniform_column(rng: Any, low: float, high: float,
+                    count: int) -> List[float]:
+    """Получить колонку равномерно распределённых значений."""
+    random = rng.random
+    span = high - low
+    return [low + span * random() for _ in repeat(None, count)]
+
+
+def _normal_column(rng: Any, low: float, high: float,
+                   count: int) -> List[float]:
+    """Получить колонку нормальных значений, усечённых границами.
+
+    Среднее — середина диапазона, до границ три сигмы.
+    """
+    gauss = rng.gauss
+    low, high = float(low), float(high)
+    mean, sigma = (low + high) / 2, (high - low) / 6
+    return [min(max(gauss(mean, sigma), low), high)
+            for _ in repeat(None, count)]
+
+
+WORKLOAD_DISTRIBUTIONS: Dict[str, Callable[..., List[float]]] = {
+    'uniform': _uniform_column,
+    'normal': _normal_column,
+}
+
+
+class WorkloadGenerator:
+    """Детерминированный генератор синтетических пакетов.
+
+    Значения создаются колонками по batch_size строк: один вызов
+    генератора на колонку вместо вызова на поле. Доли видов задаёт mix,
+    границы полей — WORKLOAD_RANGES (целые границы дают целые поля),
+    распределения полей — distributions, доли испорченных пакетов
+    по причинам из WORKLOAD_ERRORS — errors. Целые поля получаются
+    отбрасыванием дробной части. Одинаковый seed даёт одинаковый поток.
+    """
+
+    def __init__(self,
+                 mix: Optional[Dict[str, float]] = None,
+                 distributions: Optional[Dict[str, str]] = None,
+                 errors: Optional[Dict[str, float]] = None,
+                 seed: Optional[int] = None,
+                 batch_size: int = 10000) -> None:
+        import random
+
+        self.mix = mix or WORKLOAD_MIX
+        self.distributions = distributions or {}
+        self.errors = errors or {}
+        self.batch_size = batch_size
+        self.rng = random.Random(seed)
+        unknown = (set(self.distributions.values())
+                   - WORKLOAD_DISTRIBUTIONS.keys())
+        if unknown or not self.errors.keys() <= set(WORKLOAD_ERRORS):
+            raise ValueError('WorkloadNotSupported')
+
+    def _column(self, name: str, count: int) -> List[float]:
+        low, high = WORKLOAD_RANGES[name]
+        distribution = self.distributions.get(name, 'uniform')
+        column = WORKLOAD_DISTRIBUTIONS[distribution](self.rng, low, high,
+                                                      count)
+        if isinstance(low, int):
+            return list(map(int, column))
+        return column
+
+    def _iter_chosen(self, count: int,
+                     ) -> Iterator[Tuple[List[str], Dict[str, Columns]]]:
+        """Получить порции кодов тренировок и колонки полей каждого вида."""
+        workout_types = list(self.mix)
+        for offset in range(0, count, self.batch_size):
+            size = min(self.batch_size, count - offset)
+            chosen = self.rng.choices(workout_types, list(self.mix.values()),
+                                      k=size)
+            yield chosen, {workout_type: {
+                name: self._column(name, chosen.count(workout_type))
+                for name in WORKOUT_TYPES[workout_type].fields
+            } for workout_type in workout_types}
+
+    def iter_columns(self, count: int) -> Iterator[Dict[str, Columns]]:
+        """Получить порции колонок по видам тренировок без ошибок."""
+        for _, columns in self._iter_chosen(count):
+            yield columns
+
+    def _iter_batches(self, count: int) -> Iterator[List[Package]]:
+        for chosen, columns in self._iter_chosen(count):
+            rows = {workout_type: iter(zip(*fields.values()))
+                    for workout_type, fields in columns.items()}
+            yield [(workout_type, list(next(rows[workout_type])))
+                   for workout_type in chosen]
+
+    def _error_gap(self, rate: float) -> int:
+        """Получить число корректных пакетов до следующего испорченного."""
+        if rate >= 1:
+            return 0
+        return int(math.log(1.0 - self.rng.random()) / math.log(1.0 - rate))
+
+    def _corrupt(self, package: Package) -> Package:
+        workout_type, data = package
+        reason = self.rng.choices(list(self.errors),
+                                  list(self.errors.values()))[0]
+        if reason == 'WorkoutNotFound':
+            return workout_type.lower(), data
+        if reason == 'WrongPackageLength':
+            return workout_type, data[:-1]
+        if reason == 'WrongFieldType':
+            return workout_type, [str(data[0]), *data[1:]]
+        index = WORKOUT_TYPES[workout_type].positive[0]
+        return workout_type, [*data[:index], 0, *data[index + 1:]]
+
+    def iter_packages(self, count: int) -> Iterator[Package]:
+        """Получить поток пакетов с заданной долей испорченных.
+
+        Позиции испорченных пакетов выбираются геометрическими
+        промежутками, поэтому цена ошибок пропорциональна их числу.
+        """
+        rate = sum(self.errors.values())
+        position = self._error_gap(rate) if rate > 0 else count
+        offset = 0
+        for batch in self._iter_batches(count):
+            offset += len(batch)
+            while position < offset:
+                index = position - offset + len(batch)
+                batch[index] = self._corrupt(batch[index])
+                position += 1 + self._error_gap(rate)
+            yield from batch
+
+
+def make_workload(count: int,
+                  mix: Optional[Dict[str, float]] = None,
+                  seed: Optional[int] = None) -> List[Package]:
+    """Сгенерировать смесь корректных пакетов с правдоподобными значениями."""
+    return list(WorkloadGenerator(mix, seed=seed).iter_packages(count))
+
+
+@dataclass
+class LoadReport(PipelineStats):
+    """Результат нагрузочного прогона одного пути обработки."""
+    path: str = ''
+    rejected: int = 0
+    latencies: List[float] = field(default_factory=list)
+
+    MESSAGE = ('{path}: {throughput:,.0f} пакетов/с;'
+               ' задержка порции p50 {p50:.2f} мс, p95 {p95:.2f} мс,'
+               ' p99 {p99:.2f} мс; отклонено {rejected}.')
+
+    def percentile(self, percent: float) -> float:
+        """Получить задержку порции в секундах методом ближайшего ранга."""
+        if not self.latencies:
+            return 0.0
+        ordered = sorted(self.latencies)
+        rank = max(1, -(-len(ordered) * percent // 100))
+        return ordered[int(rank) - 1]
+
+    def get_message(self) -> str:
+        return self.MESSAGE.format(
+            path=self.path,
+            throughput=self.throughput,
+            p50=self.percentile(50) * 1000,
+            p95=self.percentile(95) * 1000,
+            p99=self.percentile(99) * 1000,
+            rejected=self.rejected,
+        )
+
+
+def _ignore_package(package: Package, reason: str) -> None:
+    """Отбросить некорректный пакет без записи."""
+
+
+def _serial_chunk(chunk: List[Package]) -> int:
+    """Рассчитать порцию по пакету и вернуть число отклонённых."""
+    return len(chunk) - len(list(iter_valid_messages(chunk,
+                                                     _ignore_package)))
+
+
+def _calculate_log(workout_type: str, log: TrainingLog) -> int:
+    """Проверить и рассчитать журнал колонками, вернуть число отклонённых.
+
+    Если расчёт колонок упал (например, переполнением), строки
+    пересчитываются по одной, как в последовательном пути.
+    """
+    reasons = validate_batch(workout_type, log.columns)
+    columns: Columns = log.columns
+    valid = [row for row, reason in enumerate(reasons) if reason is None]
+    if len(valid) < len(reasons):
+        columns = {name: [column[row] for row in valid]
+                   for name, column in columns.items()}
+    try:
+        log.training_class.calculate_batch(columns)
+    except ArithmeticError:
+        packages = [(workout_type, list(data))
+                    for data in zip(*columns.values())]
+        return len(reasons) - len(list(iter_valid_messages(
+            packages, _ignore_package)))
+    return len(reasons) - len(valid)
+
+
+def _batch_chunk(chunk: List[Package]) -> int:
+    """Рассчитать порцию колонками по видам и вернуть число отклонённых."""
+    logs: Dict[str, TrainingLog] = {}
+    rejected = 0
+    for workout_type, data in chunk:
+        log = logs.get(workout_type)
+        if log is None:
+            if workout_type not in WORKOUT_TYPES:
+                rejected += 1
+                continue
+            log = logs[workout_type] = TrainingLog(
+                WORKOUT_TYPES[workout_type].training_class)
+        try:
+            log.append(data)
+        except (ValueError, TypeError, ArithmeticError):
+            rejected += 1
+    for workout_type, log in logs.items():
+        rejected += _calculate_log(workout_type, log)
+    return rejected
+
+
+LOAD_PATHS: Dict[str, Callable[[List[Package]], int]] = {
+    'serial': _serial_chunk,
+    'batch': _batch_chunk,
+}
+
+
+def _load_inline(path: str, chunks: List[List[Package]]) -> LoadReport:
+    """Прогнать порции в текущем процессе."""
+    process = LOAD_PATHS[path]
+    report = LoadReport(sum(map(len, chunks)), path=path)
+    start = time.perf_counter()
+    for chunk in chunks:
+        chunk_start = time.perf_counter()
+        report.rejected += process(chunk)
+        report.latencies.append(time.perf_counter() - chunk_start)
+    report.seconds = time.perf_counter() - start
+    return report
+
+
+def _load_parallel(chunks: List[List[Package]],
+                   workers: Optional[int]) -> LoadReport:
+    """Прогнать порции в пуле процессов.
+
+    Как и в run_parallel, в работе не больше двух порций на обработчик;
+    задержка порции считается от отправки до получения результата.
+    """
+    from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+    workers = workers or os.cpu_count() or 1
+    report = LoadReport(sum(map(len, chunks)), path='parallel')
+    submitted: Dict[Future, float] = {}
+
+    def collect() -> None:
+        done, _ = wait(submitted, return_when=FIRST_COMPLETED)
+        now = time.perf_counter()
+        for future in done:
+            report.latencies.append(now - submitted.pop(future))
+            report.rejected += future.result()
+
+    start = time.perf_counter()
+    with ProcessPoolExecutor(workers) as executor:
+        for chunk in chunks:
+            if len(submitted) >= 2 * workers:
+                collect()
+            submitted[executor.submit(_serial_chunk, chunk)] = (
+                time.perf_counter())
+        while submitted:
+            collect()
+    report.seconds = time.perf_counter() - start
+    return report
+
+
+def run_load_test(packages: List[Package],
+                  paths: Iterable[str] = ('serial', 'batch', 'parallel'),
+                  chunk_size: int = 1000,
+                  workers: Optional[int] = None) -> Dict[str, LoadReport]:
+    """Прогнать один поток пакетов через пути обработки.
+
+    serial считает пакеты по одному, batch — колонками TrainingLog,
+    parallel — порциями в пуле процессов. Некорректные пакеты
+    отклоняются проверкой и не прерывают прогон.
+    """
+    chunks = list(iter_chunks(packages, chunk_size))
+    reports = {}
+    for path in paths:
+        if path == 'parallel':
+            reports[path] = _load_parallel(chunks, workers)
+        elif path in LOAD_PATHS:
+            reports[path] = _load_inline(path, chunks)
+        else:
+            raise ValueError('LoadPathNotFound')
+    return reports
+
+
+class StackSampler:
+    """Периодически снимать стек потока в формате collapsed stacks.
+
+    Строка вывода — кадры от корня через ';' и число выборок; этот
+    формат читают flamegraph.pl и speedscope.
+    """
+
+    def __init__(self,
+                 interval: float = 0.001,
+                 thread_id: Optional[int] = None) -> None:
+        import threading
+
+        self.interval = interval
+        self.thread_id = thread_id or threading.get_ident()
+        self.counts: Dict[str, int] = {}
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def __enter__(self) -> StackSampler:
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self._stopped.set()
+        self._thread.join()
+
+    def _run(self) -> None:
+        while not self._stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                name = getattr(code, 'co_qualname', code.co_name)
+                stack.append(f'{name} ('
+                             f'{os.path.basename(code.co_filename)}:'
+                             f'{code.co_firstlineno})')
+                frame = frame.f_back
+            if stack:
+                key = ';'.join(reversed(stack))
+                self.counts[key] = self.counts.get(key, 0) + 1
+
+    def write_collapsed(self, stream: TextIO) -> int:
+        """Записать свёрнутые стеки и вернуть их количество."""
+        stream.writelines(f'{stack} {count}\n'
+                          for stack, count in sorted(self.counts.items()))
+        return len(self.counts)
+
+
+@lru_cache(maxsize=None)
+def _function_spans(filename: str) -> List[Tuple[int, int, str]]:
+    """Получить строки начала и конца и полные имена функций файла."""
+    import ast
+
+    try:
+        with open(filename) as stream:
+            tree = ast.parse(stream.read())
+    except (OSError, SyntaxError, ValueError):
+        return []
+    spans = []
+    nodes = [(tree, '')]
+    while nodes:
+        node, prefix = nodes.pop()
+        for child in ast.iter_child_nodes(node):
+            name = getattr(child, 'name', None)
+            if not isinstance(name, str):
+                nodes.append((child, prefix))
+                continue
+            if not isinstance(child, ast.ClassDef):
+                spans.append((child.lineno, child.end_lineno, prefix + name))
+            nodes.append((child, f'{prefix}{name}.'))
+    return sorted(spans)
+
+
+def _function_at(filename: str, lineno: int) -> str:
+    """Получить имя самой вложенной функции, содержащей строку."""
+    name = '<module>'
+    for start, end, qualname in _function_spans(filename):
+        if start > lineno:
+            break
+        if lineno <= end:
+            name = qualname
+    return name
+
+
+def write_allocations(snapshot: Any, stream: TextIO, limit: int = 30) -> int:
+    """Записать отчёт tracemalloc, сгруппированный по функциям.
+
+    Возвращает количество функций в отчёте.
+    """
+    functions: Dict[Tuple[str, str], List[int]] = {}
+    for stat in snapshot.statistics('lineno'):
+        frame = stat.traceback[0]
+        key = (_function_at(frame.filename, frame.lineno),
+               os.path.basename(frame.filename))
+        totals = functions.setdefault(key, [0, 0])
+        totals[0] += stat.size
+        totals[1] += stat.count
+    rows = sorted(functions.items(), key=lambda item: -item[1][0])[:limit]
+    stream.write(f'{"KiB":>10} {"blocks":>9}  function\n')
+    for (name, filename), (size, count) in rows:
+        stream.write(f'{size / 1024:10.1f} {count:9d}  {name} ({filename})\n')
+    return len(rows)
+
+
+def _profiled_workload(packages: Iterable[Package],
+                       retained: Optional[list] = None) -> None:
+    """Пройти все стадии обработки пакетов, по желанию удерживая объекты.
+
+    tracemalloc видит только живые блоки, поэтому для отчёта о памяти
+    созданные объекты складываются в retained до снимка.
+    """
+    for workout_type, data in packages:
+        training = read_package(workout_type, data)
+        info = training.show_training_info()
+        message = info.get_message()
+        if retained is not None:
+            retained.append((training, info, message))
+
+
+def profile_workload(packages: List[Package],
+                     stats: TextIO,
+                     collapsed: TextIO,
+                     allocations: TextIO,
+                     interval: float = 0.001,
+                     limit: int = 30) -> PipelineStats:
+    """Профилировать read_package, расчёты и get_message для пакетов.
+
+    Первый проход идёт под cProfile и StackSampler, второй — под
+    tracemalloc: трассировка памяти неравномерно замедляет вызовы
+    и исказила бы время. Возвращает статистику первого прохода.
+    """
+    import cProfile
+    import pstats
+    import tracemalloc
+
+    profiler = cProfile.Profile()
+    start = time.perf_counter()
+    with StackSampler(interval) as sampler:
+        profiler.runcall(_profiled_workload, packages)
+    result = PipelineStats(len(packages), time.perf_counter() - start)
+    pstats.Stats(profiler, stream=stats).sort_stats(
+        'cumulative').print_stats(limit)
+    sampler.write_collapsed(collapsed)
+
+    retained: list = []
+    tracemalloc.start()
+    try:
+        _profiled_workload(packages, retained)
+        snapshot = tracemalloc.take_snapshot()
+    finally:
+        tracemalloc.stop()
+    write_allocations(snapshot.filter_traces(
+        [tracemalloc.Filter(False, tracemalloc.__file__)]), allocations, limit)
+    return result
+
+
+def shard_of(user: str, shards: int) -> int:
+    """Получить номер шарда пользователя, одинаковый во всех процессах."""
+    import zlib
+
+    return zlib.crc32(str(user).encode()) % shards
+
+
+def aggregate_by_user(records: Iterable[UserRecord],
+                      ) -> Dict[UserKey, Aggregate]:
+    """Получить итоги по пользователю и виду тренировки в одном процессе."""
+    aggregates: Dict[UserKey, Aggregate] = {}
+    for user, (workout_type, data) in records:
+        info = read_package(workout_type, data).show_training_info()
+        key = (user, info.training_type)
+        aggregate = aggregates.get(key)
+        if aggregate is None:
+            aggregate = aggregates[key] = Aggregate()
+        aggregate.add(info)
+    return aggregates
+
+
+def _encode_rows(frame: Dict[str, Any], name: str) -> bytes:
+    """Закодировать кадр шарда в JSON Lines: заголовок и строки frame[name].
+
+    Вместо списка в заголовке передаётся число строк: длинный шард
+    не упирается в ограничение длины строки asyncio.StreamReader.
+    """
+    import json
+
+    rows = frame.get(name)
+    if rows is None:
+        return json.dumps(frame).encode() + b'\n'
+    lines = [json.dumps({**frame, name: len(rows)})]
+    lines.extend(json.dumps(row) for row in rows)
+    return '\n'.join(lines).encode() + b'\n'
+
+
+async def _decode_rows(reader: asyncio.StreamReader,
+                       header: Dict[str, Any],
+                       name: str,
+                       timeout: Optional[float] = None) -> Dict[str, Any]:
+    """Дочитать строки кадра, число которых указано в header[name]."""
+    import asyncio
+    import json
+
+    rows = []
+    for _ in range(header[name]):
+        line = await asyncio.wait_for(reader.readline(), timeout)
+        if not line:
+            raise ConnectionResetError('WorkerLost')
+        rows.append(json.loads(line))
+    return {**header, name: rows}
+
+
+def answer_shard(request: Dict[str, Any]) -> Dict[str, Any]:
+    """Рассчитать ответ обработчика на шард вида {"shard", "records"}."""
+    answer: Dict[str, Any] = {'shard': request['shard']}
+    try:
+        aggregates = aggregate_by_user(request['records'])
+    except (ValueError, TypeError, ArithmeticError) as error:
+        answer['error'] = f'{type(error).__name__}: {error}'
+        return answer
+    answer['aggregates'] = [[user, training_type, asdict(aggregate)]
+                            for (user, training_type), aggregate
+                            in aggregates.items()]
+    return answer
+
+
+class ShardCoordinator:
+    """Координатор шардированной обработки записей пользователей.
+
+    Записи (пользователь, пакет) делятся на шарды по shard_of; все записи
+    пользователя попадают в один шард в исходном порядке, поэтому итоги
+    совпадают с aggregate_by_user в одном процессе. Обработчики
+    подключаются по TCP или Unix-сокету и обмениваются строками JSON Lines:
+    шард уходит одному обработчику, тот шлёт пульс, пока считает, и итоги
+    по готовности. Если обработчик молчит дольше timeout или соединение
+    оборвалось, шард возвращается в очередь и достаётся другому, но не
+    больше max_redispatch раз: дальше шард считается ошибочным.
+    """
+
+    def __init__(self,
+                 host: str = '127.0.0.1',
+                 port: int = 0,
+                 path: Optional[str] = None,
+                 timeout: float = 5.0,
+                 max_redispatch: int = 3) -> None:
+        self.host = host
+        self.port = port
+        self.path = path
+        self.timeout = timeout
+        self.max_redispatch = max_redispatch
+        self.server: Optional[asyncio.AbstractServer] = None
+        self.connections: set = set()
+        self.shards: List[List[UserRecord]] = []
+        self.results: Dict[int, Dict[str, Any]] = {}
+        self.redispatched = 0
+        self.attempts: Dict[int, int] = {}
+        self.queue: Optional[asyncio.Queue] = None
+        self.done: Optional[asyncio.Event] = None
+
+    async def start(self) -> ShardCoordinator:
+        """Начать приём обработчиков."""
+        import asyncio
+
+        self.queue = asyncio.Queue()
+        self.done = asyncio.Event()
+        if self.path:
+            self.server = await asyncio.start_unix_server(self.handle,
+                                                          self.path)
+        else:
+            self.server = await asyncio.start_server(self.handle,
+                                                     self.host,
+                                                     self.port)
+            self.port = self.server.sockets[0].getsockname()[1]
+        return self
+
+    async def close(self) -> None:
+        """Закрыть сервер и соединения с обработчиками."""
+        import asyncio
+
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+        for task in self.connections:
+            task.cancel()
+        if self.connections:
+            await asyncio.wait(self.connections)
+
+    async def __aenter__(self) -> ShardCoordinator:
+        return await self.start()
+
+    async def __aexit__(self, *args: Any) -> None:
+        await self.close()
+
+    async def run(self,
+                  records: Iterable[UserRecord],
+                  shards: int = 8,
+                  deadline: Optional[float] = None,
+                  ) -> Dict[UserKey, Aggregate]:
+        """Раздать записи обработчикам и собрать итоги всех шардов.
+
+        Если за timeout не осталось ни одного обработчика, бросает
+        ConnectionError('NoWorkersLeft'), а если шарды не посчитаны
+        за deadline секунд - TimeoutError('DeadlineExceeded').
+        """
+        self.shards = [[] for _ in range(shards)]
+        for user, package in records:
+            self.shards[shard_of(user, shards)].append((user, package))
+        self.results = {}
+        self.attempts = {}
+        self.done.clear()
+        while not self.queue.empty():
+            self.queue.get_nowait()
+        for shard, shard_records in enumerate(self.shards):
+            if shard_records:
+                self.queue.put_nowait(shard)
+            else:
+                self.results[shard] = {'aggregates': []}
+        if len(self.results) < shards:
+            await self._wait_done(deadline)
+        for answer in self.results.values():
+            if 'error' in answer:
+                raise ValueError(answer['error'])
+        aggregates = {}
+        for answer in self.results.values():
+            for user, training_type, data in answer['aggregates']:
+                aggregates[(user, training_type)] = Aggregate(**data)
+        return dict(sorted(aggregates.items()))
+
+    async def _wait_done(self, deadline: Optional[float]) -> None:
+        """Ждать итогов, раз в timeout проверяя обработчики и срок."""
+        import asyncio
+
+        loop = asyncio.get_running_loop()
+        finish = None if deadline is None else loop.time() + deadline
+        while not self.done.is_set():
+            wait = self.timeout
+            if finish is not None:
+                wait = max(0.0, min(wait, finish - loop.time()))
+            try:
+                await asyncio.wait_for(self.done.wait(), wait)
+            except asyncio.TimeoutError:
+                if finish is not None and loop.time() >= finish:
+                    raise TimeoutError('DeadlineExceeded') from None
+                if not self.connections:
+                    raise ConnectionError('NoWorkersLeft') from None
+
+    async def handle(self,
+                     reader: asyncio.StreamReader,
+                     writer: asyncio.StreamWriter) -> None:
+        """Раздавать шарды одному обработчику, пока он отвечает."""
+        import asyncio
+
+        task = asyncio.current_task()
+        self.connections.add(task)
+        shard = None
+        try:
+            while True:
+                shard = await self.queue.get()
+                if shard in self.results:
+                    continue
+                records = self.shards[shard]
+                writer.write(_encode_rows({'shard': shard,
+                                           'records': records}, 'records'))
+                await writer.drain()
+                self._finish(await self._receive(reader))
+                shard = None
+        except (asyncio.CancelledError, asyncio.TimeoutError,
+                ConnectionError, ValueError):
+            pass
+        finally:
+            if shard is not None and shard not in self.results:
+                self._redispatch(shard)
+            writer.close()
+            self.connections.discard(task)
+
+    async def _receive(self, reader: asyncio.StreamReader) -> Dict[str, Any]:
+        """Дождаться итогов шарда, пропуская пульс обработчика."""
+        import asyncio
+        import json
+
+        while True:
+            line = await asyncio.wait_for(reader.readline(), self.timeout)
+            if not line:
+                raise ConnectionResetError('WorkerLost')
+            answer = json.loads(line)
+            if 'aggregates' in answer:
+                return await _decode_rows(reader, answer, 'aggregates',
+                                          self.timeout)
+            if 'heartbeat' not in answer:
+                return answer
+
+    def _redispatch(self, shard: int) -> None:
+        attempts = self.attempts[shard] = self.attempts.get(shard, 0) + 1
+        if attempts > self.max_redispatch:
+            self._finish({'shard': shard, 'error': 'RedispatchLimit'})
+            return
+        self.queue.put_nowait(shard)
+        self.redispatched += 1
+
+    def _finish(self, answer: Dict[str, Any]) -> None:
+        self.results.setdefault(answer['shard'], answer)
+        if 'error' in answer or len(self.results) == len(self.shards):
+            self.done.set()
+
+
+async def run_worker(host: str = '127.0.0.1',
+                     port: int = 0,
+                     path: Optional[str] = None,
+                     heartbeat: float = 1.0) -> int:
+    """Обрабатывать шарды координатора, пока он не закроет соединение.
+
+    Шард считается в отдельном потоке, а соединение каждые heartbeat
+    секунд получает строку пульса. Возвращает число обработанных шардов.
+    """
+    import asyncio
+    import json
+
+    if path:
+        reader, writer = await asyncio.open_unix_connection(path)
+    else:
+        reader, writer = await asyncio.open_connection(host, port)
+    loop = asyncio.get_running_loop()
+    count = 0
+    try:
+        async for line in reader:
+            request = await _decode_rows(reader, json.loads(line), 'records')
+            future = loop.run_in_executor(None, answer_shard, request)
+            while not (await asyncio.wait({future}, timeout=heartbeat))[0]:
+                writer.write(json.dumps({'heartbeat': request['shard']})
+                             .encode() + b'\n')
+                await writer.drain()
+            writer.write(_encode_rows(future.result(), 'aggregates'))
+            await writer.drain()
+            count += 1
+    except ConnectionError:
+        pass
+    finally:
+        writer.close()
+    return count
+
+
+def _run_worker_process(host: str, port: int, heartbeat: float) -> None:
+    """Запустить обработчик шардов в отдельном процессе."""
+    import asyncio
+
+    asyncio.run(run_worker(host, port, heartbeat=heartbeat))
+
+
+def run_sharded(records: Iterable[UserRecord],
+                workers: int = 2,
+                shards: int = 8,
+                timeout: float = 5.0,
+                heartbeat: float = 1.0,
+                deadline: Optional[float] = None,
+                ) -> Dict[UserKey, Aggregate]:
+    """Посчитать итоги по пользователям в локальных процессах-обработчиках.
+
+    Для нескольких машин ShardCoordinator запускается с внешним host,
+    а обработчики подключаются командой python homework.py --worker
+    HOST:PORT.
+    """
+    import asyncio
+    import multiprocessing
+
+    context = multiprocessing.get_context('spawn')
+
+    async def coordinate() -> Dict[UserKey, Aggregate]:
+        async with ShardCoordinator(timeout=timeout) as coordinator:
+            processes = [context.Process(target=_run_worker_process,
+                                         args=(coordinator.host,
+                                               coordinator.port,
+                                               heartbeat),
+                                         daemon=True)
+                         for _ in range(workers)]
+            for process in processes:
+                process.start()
+            try:
+                return await coordinator.run(records, shards, deadline)
+            finally:
+                await coordinator.close()
+                for process in processes:
+                    process.join(timeout)
+                    if process.is_alive():
+                        process.terminate()
+
+    return asyncio.run(coordinate())
 
 
 def main(training: Training) -> None:
@@ -167,13 +2585,181 @@ def main(training: Training) -> None:
     print(info.get_message())
 
 
-if __name__ == '__main__':
-    packages = [
-        ('SWM', [720, 1, 80, 25, 40]),
-        ('RUN', [15000, 1, 75]),
-        ('WLK', [9000, 1, 75, 180]),
-    ]
+DEMO_PACKAGES = [
+    ('SWM', [720, 1, 80, 25, 40]),
+    ('RUN', [15000, 1, 75]),
+    ('WLK', [9000, 1, 75, 180]),
+]
 
-    for workout_type, data in packages:
-        training = read_package(workout_type, data)
-        main(training)
+
+async def serve_until_stopped(server: PackageServer) -> None:
+    """Обслуживать соединения до SIGINT или SIGTERM."""
+    import asyncio
+    import signal
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(signum, stop.set)
+    try:
+        async with server:
+            await stop.wait()
+    finally:
+        if server.path and os.path.exists(server.path):
+            os.unlink(server.path)
+
+
+def query_daemon(path: str,
+                 packages: List[Package]) -> Iterator[InfoMessage]:
+    """Рассчитать пакеты в запущенном демоне через Unix-сокет.
+
+    Протокол - JSON Lines, так что из shell демон доступен и без Python:
+    echo '["RUN", [15000, 1, 75]]' | nc -U PATH
+    """
+    import json
+    import socket
+    import threading
+
+    with socket.socket(socket.AF_UNIX) as sock:
+        sock.connect(path)
+
+        def send() -> None:
+            try:
+                with sock.makefile('wb') as stream:
+                    for workout_type, data in packages:
+                        stream.write(json.dumps([workout_type, data]).encode()
+                                     + b'\n')
+            finally:
+                sock.shutdown(socket.SHUT_WR)
+
+        sender = threading.Thread(target=send, daemon=True)
+        sender.start()
+        with sock.makefile('rb') as stream:
+            for line in stream:
+                answer = json.loads(line)
+                if 'error' in answer:
+                    raise ValueError(answer['error'])
+                yield InfoMessage(**answer)
+        sender.join()
+
+
+def profile_to_directory(directory: str,
+                         packages: List[Package]) -> PipelineStats:
+    """Профилировать пакеты и записать отчёты в каталог.
+
+    profile.txt — вывод pstats, stacks.folded — свёрнутые стеки
+    для flamegraph, allocations.txt — память по функциям.
+    """
+    os.makedirs(directory, exist_ok=True)
+    stats, collapsed, memory = (
+        open(os.path.join(directory, name), 'w')
+        for name in ('profile.txt', 'stacks.folded', 'allocations.txt'))
+    with stats, collapsed, memory:
+        return profile_workload(packages, stats, collapsed, memory)
+
+
+def _print_load_test(count: int,
+                     error_rate: float,
+                     seed: Optional[int]) -> None:
+    """Прогнать синтетическую нагрузку и напечатать отчёты путей."""
+    generator = WorkloadGenerator(
+        errors=dict.fromkeys(WORKLOAD_ERRORS,
+                             error_rate / len(WORKLOAD_ERRORS)),
+        seed=seed,
+    )
+    reports = run_load_test(list(generator.iter_packages(count)))
+    for report in reports.values():
+        print(report.get_message())
+
+
+def _connect_worker(address: str) -> int:
+    """Запустить обработчик шардов для HOST:PORT или пути Unix-сокета."""
+    import asyncio
+
+    host, _, port = address.rpartition(':')
+    if host:
+        return asyncio.run(run_worker(host, int(port)))
+    return asyncio.run(run_worker(path=address))
+
+
+def _read_cli_packages(args: Any) -> Iterable[Package]:
+    """Получить пакеты из аргументов, stdin или демонстрационного набора."""
+    if args.workout_type:
+        return [(args.workout_type,
+                 [_to_number(value) for value in args.data])]
+    if sys.stdin.isatty():
+        return DEMO_PACKAGES
+    return iter_packages(sys.stdin, args.format)
+
+
+def cli(argv: Optional[List[str]] = None) -> int:
+    """Точка входа командной строки.
+
+    Пакет передаётся аргументами (RUN 15000 1 75) или строками JSON Lines
+    или CSV на stdin. --serve запускает демон на Unix-сокете, --connect
+    отправляет пакеты демону, чтобы не платить за запуск расчётов,
+    --worker подключает обработчик шардов к ShardCoordinator.
+    """
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Модуль фитнес-трекера.')
+    parser.add_argument('workout_type', nargs='?')
+    parser.add_argument('data', nargs='*')
+    parser.add_argument('--format', choices=['jsonl', 'csv'],
+                        default='jsonl')
+    parser.add_argument('--serve', metavar='PATH')
+    parser.add_argument('--connect', metavar='PATH')
+    parser.add_argument('--convert', nargs=2, metavar=('SOURCE', 'TARGET'))
+    parser.add_argument('--dead-letter', metavar='PATH',
+                        help='откладывать некорректные пакеты в файл')
+    parser.add_argument('--profile', type=int, metavar='COUNT',
+                        help='профилировать синтетическую нагрузку')
+    parser.add_argument('--profile-dir', default='.', metavar='DIR')
+    parser.add_argument('--load-test', type=int, metavar='COUNT',
+                        help='прогнать синтетическую нагрузку через пути')
+    parser.add_argument('--error-rate', type=float, default=0.0,
+                        help='доля испорченных пакетов нагрузки')
+    parser.add_argument('--seed', type=int)
+    parser.add_argument('--worker', metavar='HOST:PORT|PATH',
+                        help='обрабатывать шарды координатора')
+    args = parser.parse_args(argv)
+
+    try:
+        if args.serve:
+            import asyncio
+
+            asyncio.run(serve_until_stopped(PackageServer(path=args.serve)))
+            return 0
+        if args.worker:
+            _connect_worker(args.worker)
+            return 0
+        if args.convert:
+            print(convert_packages(*args.convert, args.format))
+            return 0
+        if args.profile is not None:
+            print(profile_to_directory(args.profile_dir,
+                                       make_workload(args.profile,
+                                                     seed=args.seed)))
+            return 0
+        if args.load_test is not None:
+            _print_load_test(args.load_test, args.error_rate, args.seed)
+            return 0
+        packages = _read_cli_packages(args)
+        if args.connect:
+            write_messages(query_daemon(args.connect, list(packages)),
+                           sys.stdout)
+        elif args.dead_letter:
+            with open(args.dead_letter, 'a') as stream:
+                write_messages(iter_valid_messages(packages,
+                                                   DeadLetterSink(stream)),
+                               sys.stdout)
+        else:
+            write_messages(iter_messages(packages), sys.stdout)
+    except (ValueError, TypeError, ArithmeticError, OSError) as error:
+        print(f'{type(error).__name__}: {error}', file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(cli())
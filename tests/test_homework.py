@@ -1,7 +1,19 @@
+import asyncio
+import json
+import os
+import pickle
+import random
 import re
+import signal
+import subprocess
+import sys
+import time
 import pytest
 import types
 import inspect
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict
+from io import BytesIO, StringIO
 from conftest import Capturing
 
 try:
@@ -363,3 +375,1108 @@ def test_main_output(input_data, expected):
     assert get_message_output == expected, (
         'Метод `main` должен печатать результат в консоль.\n'
     )
+
+
+@pytest.mark.parametrize('training_class, packages', [
+    ('Swimming', [[720, 1, 80, 25, 40], [420, 4, 20, 42, 4],
+                  [1206, 12, 6, 12, 6]]),
+    ('Running', [[9000, 1, 75], [420, 4, 20], [1206, 12, 6]]),
+    ('SportsWalking', [[9000, 1, 75, 180], [420, 4, 20, 42],
+                       [1206, 12, 6, 12], [30000, 1.5, 80, 1]]),
+])
+def test_calculate_batch(training_class, packages):
+    training_class = getattr(homework, training_class)
+    names = list(inspect.signature(training_class).parameters)
+    columns = {name: [data[i] for data in packages]
+               for i, name in enumerate(names)}
+    result = training_class.calculate_batch(columns)
+    trainings = [training_class(*data) for data in packages]
+    assert result == {
+        'distance': [training.get_distance() for training in trainings],
+        'speed': [training.get_mean_speed() for training in trainings],
+        'calories': [training.get_spent_calories() for training in trainings],
+    }, (
+        'Метод `calculate_batch` должен совпадать с расчётом по объектам.'
+    )
+    fast = training_class.calculate_batch_fast(columns)
+    assert fast['calories'] == [training.get_spent_calories_fast()
+                                for training in trainings]
+    assert fast['calories'] == pytest.approx(result['calories'], rel=1e-12)
+
+
+@pytest.mark.parametrize('fmt, lines', [
+    ('jsonl', ['["SWM", [720, 1, 80, 25, 40]]\n', '\n',
+               '["RUN", [1206, 12, 6]]\n', '["WLK", [9000, 1, 75, 180]]\n']),
+    ('csv', ['SWM,720,1,80,25,40\n', 'RUN,1206,12,6\n',
+             'WLK,9000,1.0,75,180\n']),
+])
+def test_process_packages(fmt, lines):
+    sink = StringIO()
+    stats = homework.process_packages(
+        homework.iter_packages(iter(lines), fmt), sink, chunk_size=2
+    )
+    expected = [
+        homework.read_package(*package).show_training_info().get_message()
+        for package in [('SWM', [720, 1, 80, 25, 40]),
+                        ('RUN', [1206, 12, 6]),
+                        ('WLK', [9000, 1, 75, 180])]
+    ]
+    assert sink.getvalue().splitlines() == expected, (
+        'Функция `process_packages` должна записывать сообщения в sink.'
+    )
+    assert stats.packages == 3
+    assert stats.throughput > 0
+
+
+def test_iter_packages_unknown_format():
+    with pytest.raises(ValueError):
+        list(homework.iter_packages(iter(['SWM']), 'xml'))
+
+
+@pytest.mark.parametrize('ordered', [True, False])
+def test_run_parallel(ordered):
+    packages = [('SWM', [720, 1, 80, 25, 40]),
+                ('RUN', [1206, 12, 6]),
+                ('WLK', [9000, 1, 75, 180])] * 20
+    expected = [homework.read_package(*package).show_training_info()
+                for package in packages]
+    stats = {}
+    result = list(homework.run_parallel(
+        packages, workers=2, chunk_size=7, ordered=ordered, stats=stats
+    ))
+    if not ordered:
+        result.sort(key=repr)
+        expected.sort(key=repr)
+    assert result == expected, (
+        'Функция `run_parallel` должна совпадать с последовательным расчётом.'
+    )
+    assert sum(worker.packages for worker in stats.values()) == len(packages)
+
+
+@pytest.mark.parametrize('input_data, field, value', [
+    (['SWM', [720, 1, 80, 25, 40]], 'count_pool', 20),
+    (['SWM', [720, 1, 80, 25, 40]], 'length_pool', 50),
+    (['RUN', [15000, 1, 75]], 'action', 9000),
+    (['RUN', [15000, 1, 75]], 'duration', 2),
+    (['WLK', [9000, 1, 75, 180]], 'weight', 90),
+    (['WLK', [30000, 1, 75, 180]], 'height', 1),
+])
+def test_cached_training_class(input_data, field, value):
+    training_class = type(homework.read_package(*input_data))
+    cached_class = homework.cached_training_class(training_class)
+    assert issubclass(cached_class, training_class)
+    assert cached_class.__name__ == training_class.__name__
+    training = cached_class(*input_data[1])
+    before = training.show_training_info()
+    assert before == training_class(*input_data[1]).show_training_info()
+    setattr(training, field, value)
+    data = dict(zip(inspect.signature(training_class).parameters,
+                    input_data[1]))
+    data[field] = value
+    expected = training_class(**data).show_training_info()
+    assert training.show_training_info() == expected, (
+        'Кэш показателей тренировки должен сбрасываться '
+        'при изменении полей.'
+    )
+    assert expected != before
+
+
+def test_cached_metrics_computed_once():
+    calls = []
+
+    class CountingRunning(homework.Running):
+        def get_distance(self):
+            calls.append(self)
+            return super().get_distance()
+
+    cached_class = homework.cached_training_class(CountingRunning)
+    cached_class(15000, 1, 75).show_training_info()
+    assert len(calls) == 1, (
+        'Дистанция не должна пересчитываться в `show_training_info`.'
+    )
+
+
+def test_InfoMessage_slots():
+    info_message = homework.InfoMessage('Running', 1, 2, 3, 4)
+    assert not hasattr(info_message, '__dict__'), (
+        'Класс `InfoMessage` должен хранить поля в `__slots__`.'
+    )
+    assert pickle.loads(pickle.dumps(info_message)) == info_message
+
+
+@pytest.mark.parametrize('workout_type, data', [
+    ('SWM', [720, 1, 80, 25, 40]),
+    ('RUN', [15000, 1, 75]),
+    ('WLK', [9000, 1, 75, 180]),
+])
+def test_slotted_training_class(workout_type, data):
+    training_class = homework.WORKOUT_TYPES[workout_type].training_class
+    slotted_class = homework.slotted_training_class(training_class)
+    training = slotted_class(*data)
+    assert not hasattr(training, '__dict__'), (
+        'Вариант класса тренировки должен хранить поля в `__slots__`.'
+    )
+    assert slotted_class.get_fields() == training_class.get_fields()
+    assert (training.show_training_info()
+            == training_class(*data).show_training_info())
+    assert homework.slotted_training_class(training_class) is slotted_class
+    with pytest.raises(ValueError, match='WrongPackageLength'):
+        slotted_class(*data[:-1])
+
+
+@pytest.mark.parametrize('workout_type, packages', [
+    ('SWM', [[720, 1, 80, 25, 40], [420, 4, 20, 42, 4]]),
+    ('RUN', [[9000, 1, 75], [420, 4, 20], [1206, 12, 6]]),
+    ('WLK', [[9000, 1, 75, 180], [30000, 1.5, 80, 1]]),
+])
+def test_TrainingLog(workout_type, packages):
+    training_class = type(homework.read_package(workout_type, packages[0]))
+    log = homework.TrainingLog(training_class)
+    log.extend(packages)
+    assert len(log) == len(packages)
+    trainings = [training_class(*data) for data in packages]
+    assert log.calculate() == training_class.calculate_batch({
+        name: [data[i] for data in packages]
+        for i, name in enumerate(training_class.get_fields())
+    })
+    for index, training in enumerate(trainings):
+        view = log[index]
+        assert view.action == training.action
+        assert view.weight == training.weight
+        assert (view.to_training().show_training_info().get_message()
+                == training.show_training_info().get_message())
+    assert log[-1].duration == packages[-1][1]
+    with pytest.raises(IndexError):
+        log[len(packages)]
+    with pytest.raises(ValueError):
+        log.append([1, 2])
+
+
+@pytest.mark.parametrize('encoding', [None, 'utf-8'])
+def test_write_messages(encoding):
+    infos = [homework.read_package(*package).show_training_info()
+             for package in [('SWM', [720, 1, 80, 25, 40]),
+                             ('RUN', [1206, 12, 6]),
+                             ('WLK', [9000, 1, 75, 180])]]
+    expected = ''.join(info.MESSAGE.format(**asdict(info)) + '\n'
+                       for info in infos)
+    stream = BytesIO() if encoding else StringIO()
+    count = homework.write_messages(infos, stream, chunk_size=2,
+                                    encoding=encoding)
+    result = stream.getvalue()
+    assert count == len(infos)
+    assert result == (expected.encode(encoding) if encoding else expected), (
+        'Функция `write_messages` должна записывать те же сообщения, '
+        'что и `get_message`.'
+    )
+
+
+def test_compile_message_template():
+    template = homework.compile_message_template(
+        '{{{training_type!r}}} {calories:>8.1f}'
+    )
+    assert template == '{{{0!r}}} {4:>8.1f}'
+
+
+PACKAGES = [('SWM', [720, 1, 80, 25, 40]),
+            ('RUN', [1206, 12, 6]),
+            ('WLK', [9000, 1, 75, 180])]
+
+
+@pytest.mark.parametrize('unix', [False, True])
+def test_PackageServer(unix, tmp_path):
+    packages = PACKAGES * 50
+    expected = [homework.read_package(*package).show_training_info()
+                for package in packages]
+
+    async def run():
+        path = str(tmp_path / 'packages.sock') if unix else None
+        async with homework.PackageServer(path=path, batch_size=8,
+                                          queue_size=4) as server:
+            return await asyncio.gather(*(
+                homework.send_packages(packages, port=server.port,
+                                       path=path)
+                for _ in range(3)
+            ))
+
+    for result in asyncio.run(run()):
+        assert result == expected, (
+            'Сервер должен возвращать те же сообщения, что и `read_package`.'
+        )
+
+
+def test_PackageServer_errors():
+    async def run():
+        async with homework.PackageServer() as server:
+            await homework.send_packages([('XXX', [1, 1, 1])],
+                                         port=server.port)
+
+    with pytest.raises(ValueError, match='WorkoutNotFound'):
+        asyncio.run(run())
+
+
+def test_PackageServer_bad_frames():
+    frames = [b'["RUN", [' + b'1' * 70000 + b', 1, 75]]',
+              b'["RUN", [1' + b'0' * 400 + b', 1, 75]]',
+              b'[' * 5000,
+              json.dumps(PACKAGES[1]).encode()]
+
+    async def run():
+        async with homework.PackageServer() as server:
+            reader, writer = await asyncio.open_connection(server.host,
+                                                           server.port)
+            writer.write(b'\n'.join(frames) + b'\n')
+            writer.write_eof()
+            answers = [json.loads(line) async for line in reader]
+            writer.close()
+            return answers
+
+    answers = asyncio.run(asyncio.wait_for(run(), 5))
+    assert answers[0] == homework.FRAME_TOO_LONG
+    assert answers[1]['error'].startswith('OverflowError')
+    assert answers[2]['error'].startswith('RecursionError')
+    assert answers[3] == homework.read_package(
+        *PACKAGES[1]).show_training_info().to_dict()
+
+
+def test_PackageServer_close_idle():
+    async def run():
+        server = await homework.PackageServer(close_timeout=0.1).start()
+        _, writer = await asyncio.open_connection(server.host, server.port)
+        await asyncio.sleep(0.05)
+        await server.close()
+        writer.close()
+        return server.connections
+
+    assert asyncio.run(asyncio.wait_for(run(), 2)) == set(), (
+        'Простаивающее соединение не должно задерживать остановку.'
+    )
+
+
+@pytest.mark.parametrize('input_data, error', [
+    (('XXX', [9000, 1, 75]), ValueError),
+    (('RUN', [9000, 1]), ValueError),
+    (('WLK', [9000, 1, 75, 180, 1]), ValueError),
+])
+def test_read_package_errors(input_data, error):
+    with pytest.raises(error):
+        homework.read_package(*input_data)
+    with pytest.raises(error):
+        homework.read_packages([PACKAGES[0], input_data])
+
+
+def test_read_package_field_types():
+    package = ('SWM', [720, '1', 80, 25, 40])
+    with pytest.raises(TypeError):
+        homework.read_package(*package).show_training_info()
+    assert homework.validate_package(*package) == 'WrongFieldType', (
+        'Типы полей проверяет `validate_package`, а не быстрый путь.'
+    )
+
+
+def test_read_packages():
+    result = homework.read_packages(PACKAGES)
+    assert [training.show_training_info() for training in result] == [
+        homework.read_package(*package).show_training_info()
+        for package in PACKAGES
+    ]
+
+
+def test_register_workout(monkeypatch):
+    monkeypatch.setattr(homework, 'WORKOUT_TYPES',
+                        dict(homework.WORKOUT_TYPES))
+    monkeypatch.setattr(homework, 'WORKOUT_READERS',
+                        dict(homework.WORKOUT_READERS))
+
+    @homework.register_workout('BIK')
+    class Cycling(homework.Running):
+        LEN_STEP = 5.0
+
+    assert homework.WORKOUT_TYPES['BIK'].fields == (
+        'action', 'duration', 'weight'
+    )
+    training = homework.read_package('BIK', [100, 1, 75])
+    assert type(training) is Cycling
+    assert training.get_distance() == 0.5
+
+
+def test_metrics(tmp_path):
+    originals = (homework.read_package, homework.Training.show_training_info,
+                 homework.Running.get_spent_calories,
+                 homework.InfoMessage.get_message)
+    metrics = homework.enable_metrics()
+    try:
+        metrics.reset()
+        with Capturing():
+            for package in PACKAGES * 2:
+                homework.main(homework.read_package(*package))
+    finally:
+        homework.disable_metrics()
+    assert (homework.read_package, homework.Training.show_training_info,
+            homework.Running.get_spent_calories,
+            homework.InfoMessage.get_message) == originals, (
+        'После `disable_metrics` функции должны быть исходными.'
+    )
+    calls = metrics.to_dict()
+    assert calls['read_package']['count'] == 6
+    assert calls['show_training_info']['count'] == 6
+    assert calls['get_message']['count'] == 6
+    assert calls['Running.get_spent_calories']['count'] == 2
+    assert sum(calls['Swimming.get_spent_calories']['buckets'].values()) == 2
+
+    metrics.export(str(tmp_path / 'metrics.prom'))
+    text = (tmp_path / 'metrics.prom').read_text()
+    assert ('homework_call_seconds_count{function="read_package"} 6'
+            in text.splitlines())
+    assert ('homework_call_seconds_bucket'
+            '{function="read_package",le="+Inf"} 6' in text)
+    metrics.export(str(tmp_path / 'metrics.json'), 'json')
+    assert 'read_package' in (tmp_path / 'metrics.json').read_text()
+
+
+def test_Aggregate():
+    infos = [homework.read_package(*package).show_training_info()
+             for package in PACKAGES]
+    aggregate = homework.Aggregate()
+    for info in infos:
+        aggregate.add(info)
+    assert aggregate.count == 3
+    assert aggregate.totals['distance'] == pytest.approx(
+        sum(info.distance for info in infos)
+    )
+    assert aggregate.mean('speed') == pytest.approx(
+        sum(info.speed for info in infos) / 3
+    )
+    assert aggregate.minimums['calories'] == min(
+        info.calories for info in infos
+    )
+    assert aggregate.maximums['calories'] == max(
+        info.calories for info in infos
+    )
+    assert homework.Aggregate().mean('speed') == 0.0
+
+
+@pytest.mark.parametrize('step, expected_windows', [
+    (None, {0: 2, 86400: 1}),
+    (43200, {-43200: 1, 0: 2, 43200: 2, 86400: 1}),
+])
+def test_WindowedAggregator(step, expected_windows):
+    info = homework.read_package('RUN', [15000, 1, 75]).show_training_info()
+    events = [('ann', 100, info), ('ann', 50000, info), ('ann', 90000, info)]
+    whole = homework.WindowedAggregator(86400, step)
+    parts = [homework.WindowedAggregator(86400, step) for _ in range(2)]
+    for index, event in enumerate(events):
+        whole.add(*event)
+        parts[index % 2].add(*event)
+    assert {key[2]: aggregate.count
+            for key, aggregate in whole.aggregates.items()} == (
+        expected_windows
+    )
+    merged = homework.WindowedAggregator(86400, step)
+    for part in parts:
+        merged.merge(part)
+    assert merged.aggregates == whole.aggregates, (
+        'Слияние частичных итогов должно давать тот же результат.'
+    )
+    closed = whole.pop_closed(86400)
+    assert all(key[2] + 86400 <= 86400 for key in closed)
+    assert all(key[2] + 86400 > 86400 for key in whole.aggregates)
+    with pytest.raises(ValueError):
+        merged.merge(homework.WindowedAggregator(3600))
+
+
+def test_packed_roundtrip(tmp_path):
+    source = tmp_path / 'packages.jsonl'
+    source.write_text(''.join(json.dumps(package) + '\n'
+                              for package in PACKAGES * 2))
+    target = str(tmp_path / 'packages.bin')
+    assert homework.convert_packages(str(source), target) == 6
+    assert (tmp_path / 'packages.bin').stat().st_size == (
+        6 * homework.PACKED_RECORD.size
+    )
+    packages = list(homework.iter_packed(target))
+    assert packages == PACKAGES * 2
+    assert [training.show_training_info().get_message()
+            for training in homework.read_packages(packages)] == [
+        homework.read_package(*package).show_training_info().get_message()
+        for package in PACKAGES * 2
+    ]
+    logs = homework.read_packed_logs(target)
+    assert {workout_type: len(log) for workout_type, log in logs.items()} == {
+        'SWM': 2, 'RUN': 2, 'WLK': 2
+    }
+
+
+def test_packed_errors(tmp_path):
+    empty = tmp_path / 'empty.bin'
+    empty.write_bytes(b'')
+    assert list(homework.iter_packed(str(empty))) == []
+    broken = tmp_path / 'broken.bin'
+    broken.write_bytes(b'RUN\0' + b'\0' * 10)
+    with pytest.raises(ValueError):
+        list(homework.iter_packed(str(broken)))
+    with pytest.raises(ValueError):
+        homework.write_packed([('RUN', [1, 2])], BytesIO())
+    for data in ([1, '2', 3], [1, None, 3], [10 ** 400, 1, 3]):
+        with pytest.raises(TypeError, match='WrongFieldType'):
+            homework.write_packed([('RUN', data)], BytesIO())
+
+
+def test_ResultCache(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(homework.time, 'time', lambda: now[0])
+    cache = homework.ResultCache(maxsize=2, ttl=60)
+    expected = homework.read_package(*PACKAGES[1]).show_training_info()
+    assert cache.get_info(*PACKAGES[1]) == expected
+    assert cache.get_info('RUN', [1206.0, 12.0, 6.0]) is (
+        cache.get_info(*PACKAGES[1])
+    )
+    cache.get_info(*PACKAGES[0])
+    cache.get_info(*PACKAGES[2])
+    assert cache.stats() == {'hits': 2, 'disk_hits': 0, 'misses': 3,
+                             'evictions': 1, 'size': 2}
+    now[0] += 61
+    cache.get_info(*PACKAGES[2])
+    assert cache.stats()['misses'] == 4, (
+        'Устаревшие записи кэша должны рассчитываться заново.'
+    )
+    with pytest.raises(TypeError):
+        cache.get_info('RUN', ['1206', 12, 6])
+
+
+def test_ResultCache_disk(tmp_path):
+    path = str(tmp_path / 'cache')
+    cache = homework.ResultCache(path=path)
+    info = cache.get_info(*PACKAGES[0])
+    cache.close()
+    cache = homework.ResultCache(path=path)
+    assert cache.get_info(*PACKAGES[0]) == info
+    assert cache.stats()['disk_hits'] == 1
+    cache.close()
+
+
+def test_ResultCache_threads():
+    cache = homework.ResultCache(maxsize=2)
+    packages = PACKAGES * 200
+    with ThreadPoolExecutor(8) as executor:
+        result = list(executor.map(lambda package: cache.get_info(*package),
+                                   packages))
+    assert result == [homework.read_package(*package).show_training_info()
+                      for package in packages]
+    stats = cache.stats()
+    assert stats['hits'] + stats['misses'] == len(packages)
+    assert stats['size'] <= 2
+
+
+@pytest.mark.parametrize('encoding', [None, 'utf-8'])
+def test_Reporter(encoding):
+    sink = BytesIO() if encoding else StringIO()
+    packages = PACKAGES * 100
+    with homework.Reporter(sink, batch_size=7, encoding=encoding) as reporter:
+        with ThreadPoolExecutor(4) as executor:
+            infos = list(executor.map(
+                lambda package: reporter.report_package(*package), packages
+            ))
+    output = sink.getvalue()
+    if encoding:
+        output = output.decode(encoding)
+    expected = [homework.read_package(*package).show_training_info()
+                for package in packages]
+    assert infos == expected
+    assert sorted(output.splitlines()) == sorted(
+        info.get_message() for info in expected
+    ), 'Reporter должен записать каждое сообщение ровно один раз.'
+
+
+def test_cli(monkeypatch):
+    with Capturing() as output:
+        assert homework.cli(['RUN', '1206', '12', '6']) == 0
+    assert output == [homework.read_package(*PACKAGES[1])
+                      .show_training_info().get_message()]
+    monkeypatch.setattr(sys, 'stdin', StringIO(
+        'SWM,720,1,80,25,40\nWLK,9000,1,75,180\n'
+    ))
+    with Capturing() as output:
+        assert homework.cli(['--format', 'csv']) == 0
+    assert output == [homework.read_package(*package)
+                      .show_training_info().get_message()
+                      for package in (PACKAGES[0], PACKAGES[2])]
+    assert homework.cli(['XXX', '1']) == 1
+
+
+def test_cli_errors(tmp_path, capsys):
+    source = tmp_path / 'packages.jsonl'
+    source.write_text('["RUN", ["a", 1, 75]]\n')
+    assert homework.cli(['--convert', str(source),
+                         str(tmp_path / 'packages.bin')]) == 1
+    assert homework.cli(['--connect', str(tmp_path / 'missing.sock'),
+                         'RUN', '1206', '12', '6']) == 1
+    assert homework.cli(['WLK', '9000', '1e-300', '75', '1e-300']) == 1
+    errors = capsys.readouterr().err.splitlines()
+    assert errors[0] == 'TypeError: WrongFieldType'
+    assert errors[1].startswith('FileNotFoundError: ')
+    assert errors[2].startswith('OverflowError: ')
+
+
+def test_cli_zero_counts(capsys):
+    assert homework.cli(['--load-test', '0']) == 0, (
+        '--load-test 0 не должен считаться неуказанным.'
+    )
+    assert capsys.readouterr().out.startswith('serial: 0 ')
+
+
+def test_cli_daemon(tmp_path):
+    path = str(tmp_path / 'homework.sock')
+    server = subprocess.Popen(
+        [sys.executable, 'homework.py', '--serve', path],
+        cwd=os.path.dirname(homework.__file__),
+    )
+    try:
+        for _ in range(100):
+            if os.path.exists(path):
+                break
+            time.sleep(0.05)
+        with Capturing() as output:
+            assert homework.cli(['--connect', path, 'RUN', '1206', '12',
+                                 '6']) == 0
+        assert output == [homework.read_package(*PACKAGES[1])
+                          .show_training_info().get_message()]
+    finally:
+        server.send_signal(signal.SIGTERM)
+        assert server.wait(10) == 0
+    assert not os.path.exists(path)
+
+
+IMPORT_TIME_BUDGET_US = 100_000
+DEFERRED_MODULES = {'argparse', 'asyncio', 'concurrent.futures', 'csv',
+                    'hashlib', 'json', 'mmap', 'shelve', 'socket',
+                    'threading', 'typing'}
+
+
+def test_import_time():
+    directory = os.path.dirname(homework.__file__)
+    imported = subprocess.run(
+        [sys.executable, '-c',
+         'import sys; before = set(sys.modules); import homework; '
+         'print(" ".join(set(sys.modules) - before))'],
+        cwd=directory, capture_output=True, text=True, check=True,
+    ).stdout.split()
+    assert not DEFERRED_MODULES & set(imported), (
+        'Импорт `homework` не должен загружать модули отдельных режимов.'
+    )
+    report = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', 'import homework'],
+        cwd=directory, capture_output=True, text=True, check=True,
+    ).stderr.splitlines()
+    cumulative = int(report[-1].split('|')[1])
+    assert report[-1].split('|')[2].strip() == 'homework'
+    assert cumulative < IMPORT_TIME_BUDGET_US, (
+        f'Импорт `homework` занял {cumulative} мкс.'
+    )
+
+
+def make_infos(count):
+    return [homework.read_package(*PACKAGES[index % 3]).show_training_info()
+            for index in range(count)]
+
+
+def test_export_csv_jsonl():
+    infos = make_infos(7)
+    stream = StringIO()
+    assert homework.export_csv(iter(infos), stream, chunk_size=3) == 7
+    rows = stream.getvalue().splitlines()
+    assert rows[0] == 'training_type,duration,distance,speed,calories'
+    assert [float(value) for value in rows[2].split(',')[1:]] == [
+        infos[1].duration, infos[1].distance, infos[1].speed,
+        infos[1].calories
+    ], 'CSV должен хранить числа с полной точностью.'
+    stream = StringIO()
+    assert homework.export_jsonl(iter(infos), stream, chunk_size=3) == 7
+    assert [homework.InfoMessage(**json.loads(line))
+            for line in stream.getvalue().splitlines()] == infos
+
+
+def test_export_columnar(tmp_path):
+    infos = make_infos(7)
+    path = str(tmp_path / 'infos.json')
+    assert homework.export_columnar(iter(infos), path, row_group_size=3,
+                                    engine='json') == 7
+    groups = list(homework.iter_columnar(path))
+    assert [len(group['calories']) for group in groups] == [3, 3, 1]
+    assert [homework.InfoMessage(*row)
+            for group in groups
+            for row in zip(*group.values())] == infos
+    with pytest.raises(ValueError):
+        homework.export_columnar(infos, path, engine='xml')
+
+
+def write_archive(path, packages, mode='w'):
+    with open(path, mode) as stream:
+        stream.writelines(json.dumps(package) + '\n' for package in packages)
+
+
+def aggregate_packages(packages):
+    aggregates = {}
+    for package in packages:
+        info = homework.read_package(*package).show_training_info()
+        aggregates.setdefault(info.training_type,
+                              homework.Aggregate()).add(info)
+    return aggregates
+
+
+def test_replay_archives_resume(tmp_path, monkeypatch):
+    archive = str(tmp_path / 'day1.jsonl')
+    checkpoint = str(tmp_path / 'checkpoint.json')
+    write_archive(archive, PACKAGES * 10)
+    iter_valid_messages = homework.iter_valid_messages
+    calls = []
+
+    def crashing_iter_valid_messages(packages, dead_letter):
+        calls.append(1)
+        if len(calls) == 4:
+            raise RuntimeError('crash')
+        return iter_valid_messages(packages, dead_letter)
+
+    monkeypatch.setattr(homework, 'iter_valid_messages',
+                        crashing_iter_valid_messages)
+    with pytest.raises(RuntimeError):
+        homework.replay_archives([archive], checkpoint, chunk_size=4,
+                                 checkpoint_every=2)
+    monkeypatch.setattr(homework, 'iter_valid_messages',
+                        iter_valid_messages)
+    result = homework.replay_archives([archive], checkpoint, chunk_size=4,
+                                      checkpoint_every=2)
+    expected = aggregate_packages(PACKAGES * 10)
+    assert {key: aggregate.count for key, aggregate in result.items()} == {
+        key: aggregate.count for key, aggregate in expected.items()
+    }, 'После сбоя пересчёт должен продолжиться с контрольной точки.'
+    for key, aggregate in result.items():
+        assert aggregate.totals == pytest.approx(expected[key].totals)
+
+
+def test_replay_archives_incremental(tmp_path, monkeypatch):
+    day1 = str(tmp_path / 'day1.jsonl')
+    day2 = str(tmp_path / 'day2.jsonl')
+    checkpoint = str(tmp_path / 'checkpoint.json')
+    write_archive(day1, PACKAGES * 2)
+    homework.replay_archives([day1], checkpoint, chunk_size=3)
+    write_archive(day1, PACKAGES, mode='a')
+    write_archive(day2, PACKAGES * 2)
+    with open(day2, 'a') as stream:
+        stream.write('["RUN", [1, 1')
+    processed = []
+    iter_valid_messages = homework.iter_valid_messages
+
+    def counting_iter_valid_messages(packages, dead_letter):
+        packages = list(packages)
+        processed.extend(packages)
+        return iter_valid_messages(packages, dead_letter)
+
+    monkeypatch.setattr(homework, 'iter_valid_messages',
+                        counting_iter_valid_messages)
+    result = homework.replay_archives([day1, day2, day1], checkpoint,
+                                      chunk_size=3)
+    assert len(processed) == 9, (
+        'Пересчитываться должны только новые порции и новый файл.'
+    )
+    assert sum(aggregate.count for aggregate in result.values()) == 15, (
+        'Новый файл с такими же пакетами нужно учесть, а повторно '
+        'указанный - нет.'
+    )
+
+
+def test_replay_archives_rewritten(tmp_path, monkeypatch):
+    archive = str(tmp_path / 'day1.jsonl')
+    checkpoint = str(tmp_path / 'checkpoint.json')
+    write_archive(archive, PACKAGES * 2)
+    homework.replay_archives([archive], checkpoint, chunk_size=2)
+    processed = []
+    iter_valid_messages = homework.iter_valid_messages
+
+    def counting_iter_valid_messages(packages, dead_letter):
+        packages = list(packages)
+        processed.extend(packages)
+        return iter_valid_messages(packages, dead_letter)
+
+    monkeypatch.setattr(homework, 'iter_valid_messages',
+                        counting_iter_valid_messages)
+    write_archive(archive, PACKAGES * 2 + [PACKAGES[0]])
+    homework.replay_archives([archive], checkpoint, chunk_size=2)
+    assert processed == [PACKAGES[0]], (
+        'Неизменённый файл нужно продолжать с сохранённого смещения.'
+    )
+    processed.clear()
+    write_archive(archive, PACKAGES[::-1] * 3)
+    result = homework.replay_archives([archive], checkpoint, chunk_size=2)
+    assert len(processed) == 9, (
+        'Переписанный файл нужно прочитать заново, даже если он длиннее.'
+    )
+    expected = aggregate_packages(PACKAGES[::-1] * 3)
+    assert {key: aggregate.count for key, aggregate in result.items()} == {
+        key: aggregate.count for key, aggregate in expected.items()
+    }, 'Итоги прежней версии файла не должны оставаться в сумме.'
+    for key, aggregate in result.items():
+        assert aggregate.totals == pytest.approx(expected[key].totals)
+
+
+def test_replay_archives_tail_and_dead_letters(tmp_path):
+    archive = tmp_path / 'day1.jsonl'
+    checkpoint = str(tmp_path / 'checkpoint.json')
+    archive.write_text('["RUN", [15000, 0, 75]]\n'
+                       + '\n'.join(json.dumps(package)
+                                   for package in PACKAGES[:2]))
+    dead_letters = []
+    result = homework.replay_archives(
+        [str(archive)], checkpoint,
+        dead_letter=lambda package, reason: dead_letters.append(reason))
+    assert sum(aggregate.count for aggregate in result.values()) == 1
+    assert dead_letters == ['NonPositiveField:duration'], (
+        'Некорректный пакет архива должен уходить в dead_letter.'
+    )
+    with open(checkpoint) as stream:
+        position = json.load(stream)['files'][str(archive)]
+    assert position['rejected'] == 1
+    assert position['tail'] == len(json.dumps(PACKAGES[1])), (
+        'Недописанная строка растущего файла должна учитываться в tail.'
+    )
+    result = homework.replay_archives([str(archive)], checkpoint, settle=0)
+    assert sum(aggregate.count for aggregate in result.values()) == 2, (
+        'Последнюю строку неизменного архива нужно обработать.'
+    )
+    with open(checkpoint) as stream:
+        assert json.load(stream)['files'][str(archive)]['tail'] == 0
+
+
+def random_package(rng, workout_type):
+    data = [rng.randint(1, 100000), rng.uniform(0.05, 24),
+            rng.uniform(20, 200)]
+    if workout_type == 'WLK':
+        data.append(rng.randint(50, 250))
+    if workout_type == 'SWM':
+        data += [rng.randint(10, 100), rng.randint(1, 200)]
+    return data
+
+
+@pytest.mark.parametrize('workout_type', ['SWM', 'RUN', 'WLK'])
+def test_get_spent_calories_fast(workout_type):
+    rng = random.Random(workout_type)
+    for _ in range(20000):
+        training = homework.read_package(
+            workout_type, random_package(rng, workout_type)
+        )
+        scale = (training.weight * training.duration
+                 * (1 + training.get_mean_speed() ** 2))
+        assert training.get_spent_calories_fast() == pytest.approx(
+            training.get_spent_calories(), rel=1e-12, abs=1e-12 * scale
+        ), 'Быстрая формула должна совпадать с исходной.'
+
+
+def test_compile_coefficients_subclasses():
+    class Cycling(homework.Running):
+        LEN_STEP = 5.0
+
+    class Custom(homework.Running):
+        def get_spent_calories(self):
+            return 1.0
+
+    cycling = Cycling(1000, 2, 70)
+    assert cycling.DISTANCE_FACTOR == 5.0 / 1000
+    assert cycling.get_spent_calories_fast() == pytest.approx(
+        cycling.get_spent_calories(), rel=1e-12
+    )
+    assert Custom(1000, 2, 70).get_spent_calories_fast() == 1.0, (
+        'Подкласс со своей формулой должен считать обычным путём.'
+    )
+    assert Custom.calculate_batch(
+        {'action': [1000], 'duration': [2], 'weight': [70]}
+    )['calories'] == [1.0]
+    assert Custom.calculate_batch_fast(
+        {'action': [1000], 'duration': [2], 'weight': [70]}
+    )['calories'] == [1.0]
+    assert Cycling.get_batch_spent_calories_fast(
+        {'action': [1000], 'duration': [2], 'weight': [70]}, [2.5]
+    ) == [cycling.get_spent_calories_fast()]
+
+
+@pytest.mark.parametrize('package, reason', [
+    (('XXX', [9000, 1, 75]), 'WorkoutNotFound'),
+    (('RUN', [9000, 1]), 'WrongPackageLength'),
+    (('SWM', [720, '1', 80, 25, 40]), 'WrongFieldType'),
+    (('RUN', [9000, 0, 75]), 'NonPositiveField:duration'),
+    (('WLK', [9000, 1, 75, 0]), 'NonPositiveField:height'),
+    (('SWM', [720, float('nan'), 80, 25, 40]), 'NonPositiveField:duration'),
+])
+def test_iter_valid_messages(package, reason):
+    assert homework.validate_package(*package) == reason
+    stream = StringIO()
+    dead_letter = homework.DeadLetterSink(stream)
+    result = list(homework.iter_valid_messages(
+        [PACKAGES[0], package, PACKAGES[1]], dead_letter
+    ))
+    assert result == [homework.read_package(*package).show_training_info()
+                      for package in PACKAGES[:2]], (
+        'Некорректный пакет не должен прерывать обработку остальных.'
+    )
+    assert dead_letter.counts == {reason: 1}
+    assert json.loads(stream.getvalue())['reason'] == reason
+
+
+@pytest.mark.parametrize('package', [
+    ('RUN', [10 ** 400, 1, 75]),
+    ('WLK', [9000, 1e-300, 75, 1e-300]),
+])
+def test_iter_valid_messages_calculation_errors(package):
+    dead_letters = []
+    result = list(homework.iter_valid_messages(
+        [PACKAGES[0], package, PACKAGES[1]],
+        lambda package, reason: dead_letters.append(reason),
+    ))
+    assert len(result) == 2, (
+        'Пакет, сломавший расчёт, не должен прерывать обработку остальных.'
+    )
+    assert dead_letters == ['CalculationError:OverflowError']
+
+
+def test_validate_batch():
+    log = homework.TrainingLog(homework.SportsWalking)
+    log.extend([[9000, 1, 75, 180], [9000, 0, 75, 180], [9000, 1, 75, 0],
+                [9000, -1, 75, 0]])
+    assert homework.validate_batch('WLK', log.columns) == [
+        None, 'NonPositiveField:duration', 'NonPositiveField:height',
+        'NonPositiveField:duration',
+    ]
+    for value, valid in [(-0.0, False), (float('nan'), False),
+                         (float('-nan'), False), (5e-324, True),
+                         (float('inf'), True), (1e308, True)]:
+        for row in (0, 2):
+            log = homework.TrainingLog(homework.SportsWalking)
+            log.extend([[9000, 1, 75, 180]] * 3)
+            log.columns['height'][row] = value
+            reasons = homework.validate_batch('WLK', log.columns)
+            assert reasons[row] == (None if valid
+                                    else 'NonPositiveField:height'), value
+            reasons = homework.validate_batch(
+                'WLK', {name: list(column)
+                        for name, column in log.columns.items()})
+            assert reasons[row] == (None if valid
+                                    else 'NonPositiveField:height'), value
+    assert all(homework.validate_package(*package) is None
+               for package in PACKAGES)
+
+
+def test_make_workload():
+    packages = homework.make_workload(1000, seed=7)
+    assert packages == homework.make_workload(1000, seed=7), (
+        'Нагрузка с одинаковым seed должна совпадать.'
+    )
+    assert all(homework.validate_package(*package) is None
+               for package in packages)
+    assert {workout_type for workout_type, _ in packages} == {
+        'SWM', 'RUN', 'WLK'}
+    assert {workout_type for workout_type, _ in homework.make_workload(
+        100, mix={'RUN': 1}, seed=7)} == {'RUN'}
+
+
+def test_profile_workload(tmp_path):
+    packages = homework.make_workload(20000, seed=1)
+    stats = homework.profile_to_directory(str(tmp_path), packages)
+    assert stats.packages == len(packages)
+    assert 'read_package' in (tmp_path / 'profile.txt').read_text()
+    stacks = (tmp_path / 'stacks.folded').read_text().splitlines()
+    assert stacks and all(re.fullmatch(r'\S.*;.* \d+', line)
+                          for line in stacks), (
+        'Стеки должны быть в формате collapsed stacks.'
+    )
+    allocations = (tmp_path / 'allocations.txt').read_text()
+    for name in ('read_package', 'show_training_info', 'get_message'):
+        assert name in allocations
+
+
+def test_WorkloadGenerator():
+    errors = {'WorkoutNotFound': 0.05, 'WrongFieldType': 0.05,
+              'WrongPackageLength': 0.05, 'NonPositiveField': 0.05}
+    packages = list(homework.WorkloadGenerator(
+        errors=errors, seed=3, batch_size=700).iter_packages(5000))
+    assert packages == list(homework.WorkloadGenerator(
+        errors=errors, seed=3, batch_size=700).iter_packages(5000)), (
+        'Поток с одинаковым seed должен совпадать.'
+    )
+    reasons = [homework.validate_package(*package) for package in packages]
+    assert len(packages) == 5000
+    assert 0.15 < 1 - reasons.count(None) / len(reasons) < 0.25
+    assert {reason.split(':')[0] for reason in reasons if reason} == set(
+        errors)
+
+    generator = homework.WorkloadGenerator(
+        mix={'WLK': 1}, distributions={'height': 'normal'}, seed=3)
+    (columns,) = generator.iter_columns(2000)
+    heights = columns['WLK']['height']
+    assert len(heights) == 2000
+    assert all(isinstance(value, int) and 150 <= value <= 200
+               for value in heights)
+    with pytest.raises(ValueError, match='WorkloadNotSupported'):
+        homework.WorkloadGenerator(distributions={'height': 'zipf'})
+
+
+def test_batch_chunk_rejects_like_serial():
+    chunk = PACKAGES * 3 + [
+        ('XXX', [9000, 1, 75]),
+        ('RUN', [9000, 1]),
+        ('SWM', [720, '1', 80, 25, 40]),
+        ('RUN', [9000, 0, 75]),
+        ('WLK', [9000, 1, 75, float('nan')]),
+        ('WLK', [9000, 1e-300, 75, 1e-300]),
+        ('RUN', [10 ** 400, 1, 75]),
+    ]
+    assert homework._batch_chunk(chunk) == homework._serial_chunk(chunk) == 7
+
+
+def test_TrainingLog_append_atomic():
+    log = homework.TrainingLog(homework.Running)
+    with pytest.raises(TypeError):
+        log.append([9000, 1, '75'])
+    assert [len(column) for column in log.columns.values()] == [0, 0, 0], (
+        'Отклонённая строка не должна попадать в часть колонок.'
+    )
+
+
+def test_run_load_test():
+    packages = list(homework.WorkloadGenerator(
+        errors={'NonPositiveField': 0.02}, seed=5).iter_packages(3000))
+    rejected = sum(homework.validate_package(*package) is not None
+                   for package in packages)
+    reports = homework.run_load_test(packages, chunk_size=500, workers=2)
+    assert list(reports) == ['serial', 'batch', 'parallel']
+    for path, report in reports.items():
+        assert report.packages == 3000
+        assert report.rejected == rejected
+        assert len(report.latencies) == 6
+        assert report.percentile(50) <= report.percentile(99)
+        assert report.get_message().startswith(f'{path}: ')
+    with pytest.raises(ValueError, match='LoadPathNotFound'):
+        homework.run_load_test(packages, paths=['gpu'])
+
+
+def make_user_records(count, users=50, seed=0):
+    rng = random.Random(seed)
+    return [(f'user{rng.randrange(users)}', package)
+            for package in homework.make_workload(count, seed=seed)]
+
+
+def test_run_sharded():
+    records = make_user_records(3000)
+    result = homework.run_sharded(records, workers=2, shards=5)
+    assert result == homework.aggregate_by_user(records), (
+        'Итоги шардированной обработки должны совпадать с итогами '
+        'одного процесса.'
+    )
+    assert {homework.shard_of(user, 5) for user, _ in result} == set(
+        range(5))
+
+
+@pytest.mark.parametrize('lost', ['silent', 'closed'])
+def test_ShardCoordinator_redispatch(lost):
+    records = make_user_records(500, users=10, seed=1)
+
+    async def run():
+        async with homework.ShardCoordinator(timeout=0.3) as coordinator:
+            reader, writer = await asyncio.open_connection(
+                coordinator.host, coordinator.port)
+            running = asyncio.ensure_future(coordinator.run(records, 3))
+            assert 'shard' in json.loads(await reader.readline())
+            if lost == 'closed':
+                writer.close()
+            worker = asyncio.ensure_future(homework.run_worker(
+                coordinator.host, coordinator.port, heartbeat=0.05))
+            result = await running
+            writer.close()
+        assert await worker == 3
+        return result, coordinator.redispatched
+
+    result, redispatched = asyncio.run(run())
+    assert redispatched == 1, 'Потерянный шард нужно отдать другому.'
+    assert result == homework.aggregate_by_user(records)
+
+
+def test_ShardCoordinator_errors():
+    async def run():
+        async with homework.ShardCoordinator() as coordinator:
+            worker = asyncio.ensure_future(homework.run_worker(
+                coordinator.host, coordinator.port))
+            try:
+                await coordinator.run([('user', ('XXX', [1, 1, 1]))])
+            finally:
+                await coordinator.close()
+                await worker
+
+    with pytest.raises(ValueError, match='WorkoutNotFound'):
+        asyncio.run(run())
+
+
+def test_ShardCoordinator_calculation_error():
+    records = [('user', ('RUN', [15000, 1, 75])),
+               ('user', ('RUN', [10 ** 400, 1, 75]))]
+
+    async def run():
+        async with homework.ShardCoordinator(timeout=0.3) as coordinator:
+            worker = asyncio.ensure_future(homework.run_worker(
+                coordinator.host, coordinator.port))
+            try:
+                await coordinator.run(records, 1)
+            finally:
+                await coordinator.close()
+                assert await worker == 1, (
+                    'Ошибка расчёта не должна ронять обработчик.'
+                )
+
+    with pytest.raises(ValueError, match='OverflowError'):
+        asyncio.run(run())
+
+
+async def lose_shards(coordinator, count):
+    for _ in range(count):
+        reader, writer = await asyncio.open_connection(
+            coordinator.host, coordinator.port)
+        await reader.readline()
+        writer.close()
+        await writer.wait_closed()
+
+
+def test_ShardCoordinator_redispatch_limit():
+    async def run():
+        async with homework.ShardCoordinator(
+                timeout=5, max_redispatch=2) as coordinator:
+            running = asyncio.ensure_future(
+                coordinator.run(make_user_records(10), 1))
+            await lose_shards(coordinator, 3)
+            return await running
+
+    with pytest.raises(ValueError, match='RedispatchLimit'):
+        asyncio.run(run())
+
+
+def test_ShardCoordinator_no_workers():
+    async def run():
+        async with homework.ShardCoordinator(timeout=0.2) as coordinator:
+            running = asyncio.ensure_future(
+                coordinator.run(make_user_records(10), 1))
+            await lose_shards(coordinator, 1)
+            return await running
+
+    with pytest.raises(ConnectionError, match='NoWorkersLeft'):
+        asyncio.run(run())
+
+
+def test_ShardCoordinator_deadline():
+    async def run():
+        async with homework.ShardCoordinator(timeout=5) as coordinator:
+            reader, writer = await asyncio.open_connection(
+                coordinator.host, coordinator.port)
+            try:
+                return await coordinator.run(make_user_records(10), 1,
+                                             deadline=0.2)
+            finally:
+                writer.close()
+
+    with pytest.raises(TimeoutError, match='DeadlineExceeded'):
+        asyncio.run(run())